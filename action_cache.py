@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import zlib
+from collections import OrderedDict
+import content_store
+import object_store
+from blob_cache import cache_folder
+
+
+def gumtree_version(jar_path):
+    """用 gumtree.jar 的内容哈希标识 GumTree 版本，替换 jar 后旧的缓存自动失效"""
+    sha1 = hashlib.sha1()
+    try:
+        with open(jar_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                sha1.update(chunk)
+    except OSError:
+        return "unknown"
+    return sha1.hexdigest()
+
+
+class ActionCache(object):
+    """GumTree 编辑动作的持久化缓存，键为 (GumTree 版本/参数, 旧文件 blob id, 新文件 blob id)，
+    按总大小淘汰最久未使用的条目（命中时更新文件的 mtime）"""
+
+    def __init__(self, cache_dir, options, max_bytes=1024 * 1024 * 1024, max_memory_entries=1024):
+        self.cache_dir = cache_dir
+        self.options = options
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.store = object_store.ObjectStore(self.cache_dir)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        for prefix in os.scandir(self.cache_dir):
+            if not prefix.is_dir():
+                continue
+            for entry in os.scandir(prefix.path):
+                if entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                yield entry.path, stat.st_mtime, stat.st_size
+
+    def key(self, old_content, new_content):
+        key_text = f"{self.options}\0{content_store.blob_id(old_content)}\0{content_store.blob_id(new_content)}"
+        return hashlib.sha1(key_text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, actions):
+        self.memory[key] = actions
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, old_content, new_content):
+        """返回缓存的动作列表，未命中时返回 None"""
+        key = self.key(old_content, new_content)
+        actions = self.memory.get(key)
+        if actions is not None:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return actions
+        try:
+            actions = json.loads(self.store.read(key))
+            os.utime(self.store.path(key))
+        except (OSError, ValueError, zlib.error):
+            self.misses += 1
+            return None
+        self._remember(key, actions)
+        self.hits += 1
+        return actions
+
+    def put(self, old_content, new_content, actions):
+        key = self.key(old_content, new_content)
+        self._remember(key, actions)
+        self.total_bytes += self.store.write(key, json.dumps(actions).encode("utf-8"))
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """按 mtime 从旧到新删除条目，直到总大小降到上限的 90% 以下"""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.evicted += 1
+
+    def report(self):
+        return format_report(self.hits, self.misses)
+
+
+def format_report(hits, misses):
+    total = hits + misses
+    hit_rate = hits / total * 100 if total else 0.0
+    return f"gumtree action cache: {hits} hits, {misses} misses ({hit_rate:.1f}% hit rate)"
+
+
+def open_action_cache(jar_path, backend):
+    """所有项目共用一个缓存目录：cache/gumtree；backend 区分常驻服务与 textdiff 两种生成方式"""
+    options = f"{gumtree_version(jar_path)}:{backend}:JSON"
+    return ActionCache(os.path.join(cache_folder, "gumtree"), options)
@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+from interval_index import SpanIndex
+
+# strategy_5 中重构覆盖检查的微基准：对比逐个重构位置重建 test_changes 列表的原实现与 SpanIndex，
+# 模拟一个带有数百条 RefactoringMiner 结果的 commit
+
+
+def make_case(rng, file_size, refactorings, locations, changes):
+    spans = []
+    for _ in range(refactorings * locations):
+        start = rng.randrange(file_size)
+        spans.append((start, start + rng.randint(0, 2000)))
+    test_changes = []
+    for _ in range(changes):
+        start = rng.randrange(file_size)
+        test_changes.append((start, start + rng.randint(0, 200)))
+    return spans, test_changes
+
+
+def remove_covered_list(spans, test_changes):
+    # 原实现：每个重构位置都用列表推导式重建一次 test_changes
+    test_changes = list(test_changes)
+    for start_index, end_index in spans:
+        test_changes[:] = [change for change in test_changes if not (start_index <= change[0] and end_index >= change[1])]
+    return test_changes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--refactorings", type=int, default=500)
+    parser.add_argument("--locations", type=int, default=3, help="leftSideLocations per refactoring")
+    parser.add_argument("--changes", type=int, default=2000, help="test change ranges per sample")
+    parser.add_argument("--file_size", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    cases = [make_case(rng, args.file_size, args.refactorings, args.locations, args.changes) for _ in range(args.cases)]
+
+    start = time.time()
+    expected = [remove_covered_list(spans, test_changes) for spans, test_changes in cases]
+    list_time = time.time() - start
+
+    start = time.time()
+    actual = [SpanIndex(spans).remove_covered(test_changes) for spans, test_changes in cases]
+    index_time = time.time() - start
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"{args.cases} cases, {args.refactorings * args.locations} refactoring spans x {args.changes} test changes each")
+    print(f"mismatches: {mismatches}")
+    print(f"list rebuild: {list_time:.3f}s, SpanIndex: {index_time:.3f}s, speedup x{list_time / max(index_time, 1e-9):.0f}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import random
+import re
+import time
+import javalang_tokenizer
+import java_identifiers
+
+# strategy_4 标识符提取的检查与微基准：
+# 1. 在任意位置截断的修改片段（数字字面量、\u 转义、字符串、注释结尾等）不能抛出异常，且只提取标识符；
+# 2. 与完整的 Java 词法分析结果对比，并对比原来按分隔符切分、词法分析和 java_identifiers 三者的耗时
+
+split_pattern = re.compile(r'[ @\n\\/,;{}\[\]()\.\+=:"]+')
+
+# (片段, 期望的标识符)
+TRUNCATED_SNIPPETS = [
+    ("i = 0", {"i"}),
+    ("size > 0", {"size"}),
+    ("count = 10", {"count"}),
+    ("x = 0x", {"x"}),
+    ("y = 0b", {"y"}),
+    ("z = 1.5e", {"z"}),
+    ("w = 0x1.", {"w"}),
+    ("name = \"abc", {"name"}),
+    ("char c = '", {"c"}),
+    ("a /* comment", {"a"}),
+    ("s = \"\\u00", {"s"}),
+    ("t\\u00", {"t"}),
+    ("v = \\u0g", {"v", "g"}),
+    ("u \\", {"u"}),
+    ("", set()),
+]
+
+SAMPLE_CODE = """    @Test
+    public void testAddItem() throws Exception {
+        List<String> items = new ArrayList<>(10);
+        items.add("value " + index);
+        assertEquals(0x1F, cart.size() + 0);
+        /* check the total */
+        double total = cart.total(1.5e3, 'c');
+    }
+"""
+
+
+def regex_identifiers(content, ranges):
+    # 原实现：按分隔符切分，关键字、字面量和空串也会计入
+    identifiers = set()
+    for start, end in ranges:
+        identifiers.update(split_pattern.split(content[start:end]))
+    return identifiers
+
+
+def lexer_identifiers(content, ranges):
+    # 用 JavaTokenizer 逐个范围做完整的词法分析，截断处的异常忽略，保留已经识别出的 token
+    identifiers = set()
+    for start, end in java_identifiers.merge_ranges(ranges):
+        try:
+            for token in javalang_tokenizer.JavaTokenizer(content[start:end], ignore_errors=True).tokenize():
+                if isinstance(token, javalang_tokenizer.Identifier):
+                    identifiers.add(token.value)
+        except Exception:
+            pass
+    return identifiers
+
+
+def make_ranges(rng, content, count, parents=0):
+    """count 个随机范围；parents > 0 时从 parents 个父节点范围中选取，模拟多个动作共用同一个父节点"""
+    if parents > 0:
+        pool = make_ranges(rng, content, parents)
+        return [rng.choice(pool) for _ in range(count)]
+    ranges = []
+    for _ in range(count):
+        start = rng.randrange(len(content))
+        ranges.append((start, min(len(content), start + rng.randint(1, 120))))
+    return ranges
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=2000)
+    parser.add_argument("--ranges", type=int, default=8, help="changed parent ranges per side")
+    parser.add_argument("--parents", type=int, default=0, help="distinct parents the ranges are drawn from (0: all distinct)")
+    args = parser.parse_args()
+
+    failures = 0
+    for snippet, expected in TRUNCATED_SNIPPETS:
+        try:
+            names = java_identifiers.identifier_set(snippet, [(0, len(snippet))])
+        except Exception as e:
+            print(f"{snippet!r}: raised {e.__class__.__name__}: {e}")
+            failures += 1
+            continue
+        if names != expected:
+            print(f"{snippet!r}: expected {sorted(expected)}, got {sorted(names)}")
+            failures += 1
+    print(f"truncated snippets: {len(TRUNCATED_SNIPPETS)}, failures: {failures}")
+
+    # 随机截断位置：每个范围都从任意字符开始、在任意字符结束
+    rng = random.Random(0)
+    content = SAMPLE_CODE * 20
+    cases = [make_ranges(rng, content, args.ranges, args.parents) for _ in range(args.cases)]
+    errors = 0
+    actual = []
+    start = time.time()
+    for ranges in cases:
+        try:
+            actual.append(java_identifiers.identifier_set(content, ranges))
+        except Exception:
+            actual.append(None)
+            errors += 1
+    scan_time = time.time() - start
+
+    start = time.time()
+    expected = [lexer_identifiers(content, ranges) for ranges in cases]
+    lexer_time = time.time() - start
+
+    start = time.time()
+    for ranges in cases:
+        regex_identifiers(content, ranges)
+    regex_time = time.time() - start
+
+    # 只在截断位置附近可能不同（例如从字符串中间开始的范围），完整的范围应当一致
+    mismatches = sum(1 for a, b in zip(actual, expected) if a != b)
+    whole = java_identifiers.identifier_set(SAMPLE_CODE, [(0, len(SAMPLE_CODE))])
+    whole_expected = lexer_identifiers(SAMPLE_CODE, [(0, len(SAMPLE_CODE))])
+    print(f"random truncations: {args.cases} cases x {args.ranges} ranges, exceptions: {errors}, "
+          f"differences from the lexer: {mismatches}")
+    print(f"whole sample matches the lexer: {whole == whole_expected}")
+    print(f"regex split: {regex_time:.3f}s, lexer: {lexer_time:.3f}s, java_identifiers: {scan_time:.3f}s "
+          f"(x{lexer_time / max(scan_time, 1e-9):.0f} faster than the lexer, x{regex_time / max(scan_time, 1e-9):.1f} vs regex split)")
+    if failures or errors or whole != whole_expected:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
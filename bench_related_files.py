@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import subprocess
+import tempfile
+import time
+import git_commit_index
+from filter_PT_pair import related_files_between_commits
+
+# 对比 related_files_between_commits 的 commit_index 版本与逐个调用 git 的版本：
+# 在提交间隔跨越多天的合成仓库上检查两者结果一致，并统计原来 .seconds 窗口算错的查询数量和两者的耗时
+
+
+def build_repo(repo_path, commits=200, files=40, seed=0):
+    """生成一个提交间隔从半小时到数天不等的合成仓库"""
+    rng = random.Random(seed)
+    os.makedirs(repo_path, exist_ok=True)
+    subprocess.run(["git", "init", "-q", repo_path], check=True)
+    paths = [f"module{i % 4}/src/{'main' if i % 2 else 'test'}/java/org/demo/File{i}.java" for i in range(files)]
+    current_time = 1600000000
+    for i in range(commits):
+        current_time += rng.choice([1800, 3 * 3600, 20 * 3600, 2 * 86400 + 3600, 5 * 86400 + 7200])
+        for path in rng.sample(paths, rng.randint(1, 4)):
+            full_path = os.path.join(repo_path, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "a") as file:
+                file.write(f"// change {i}\n")
+        date = f"{current_time} +0000"
+        env = dict(os.environ, GIT_AUTHOR_DATE=date, GIT_COMMITTER_DATE=date,
+                   GIT_AUTHOR_NAME="bench", GIT_AUTHOR_EMAIL="bench@example.com",
+                   GIT_COMMITTER_NAME="bench", GIT_COMMITTER_EMAIL="bench@example.com")
+        subprocess.run(["git", "-C", repo_path, "add", "-A"], check=True, env=env)
+        subprocess.run(["git", "-C", repo_path, "commit", "-q", "-m", f"commit {i}"], check=True, env=env)
+    return paths
+
+
+def legacy_related_files(old_commit, new_commit, product_file_path, test_file_path, commit_index):
+    """原来的窗口计算：(new_time - old_time).seconds 丢掉了天数部分，且为 0 时窗口没有上界"""
+    if old_commit == new_commit:
+        return False
+    old_time = commit_index.get_commit_date(old_commit)
+    new_time = commit_index.get_commit_date(new_commit)
+    since, until = commit_index.window(old_commit, 0, (new_time - old_time).seconds / 3600)
+    for file_path in (product_file_path, test_file_path):
+        if file_path and commit_index.path_changed_between(file_path, since, until, (old_commit, new_commit)):
+            return True
+    return test_file_path in commit_index.get_changed_files(old_commit) \
+        or product_file_path in commit_index.get_changed_files(new_commit)
+
+
+def make_queries(commit_index, paths, count, seed=0):
+    # 与构造样本时相同：test commit 在 product commit 之后 0 ~ 468 小时内
+    rng = random.Random(seed)
+    commits = commit_index.commits
+    queries = []
+    while len(queries) < count:
+        i = rng.randrange(len(commits))
+        j = max(0, i - rng.randint(0, 30))
+        old_commit, new_commit = commits[i], commits[j]
+        if new_commit.commit_time - old_commit.commit_time > 468 * 3600:
+            continue
+        queries.append((old_commit.hash, new_commit.hash, rng.choice(paths), rng.choice(paths + [""])))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repo", help="existing synthetic repository (created in a temporary directory if omitted)")
+    parser.add_argument("--commits", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    repo_path = args.repo or os.path.join(tempfile.mkdtemp(prefix="bench_related_"), "repo")
+    if not os.path.isdir(os.path.join(repo_path, ".git")):
+        print(f"Building synthetic repository with {args.commits} commits in {repo_path}")
+        build_repo(repo_path, args.commits)
+
+    start = time.time()
+    commit_index = git_commit_index.build_commit_index(repo_path)
+    index_time = time.time() - start
+    paths = sorted({path for commit in commit_index.commits for _, path in commit.changes})
+    queries = make_queries(commit_index, paths, args.queries)
+
+    start = time.time()
+    expected = [related_files_between_commits(old, new, repo_path, product, test) for old, new, product, test in queries]
+    subprocess_time = time.time() - start
+
+    start = time.time()
+    actual = [related_files_between_commits(old, new, repo_path, product, test, commit_index) for old, new, product, test in queries]
+    indexed_time = time.time() - start
+
+    legacy = [legacy_related_files(old, new, product, test, commit_index) for old, new, product, test in queries]
+    multi_day = sum(1 for old, new, _, _ in queries
+                    if abs(commit_index.get_commit(new).commit_time - commit_index.get_commit(old).commit_time) >= 86400)
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    legacy_mismatches = sum(1 for a, b in zip(expected, legacy) if a != b)
+    print(f"queries: {len(queries)} ({multi_day} span more than one day), related: {sum(expected)}")
+    print(f"commit_index vs git subprocess mismatches: {mismatches}")
+    print(f"legacy .seconds window mismatches: {legacy_mismatches}")
+    print(f"git subprocess: {subprocess_time:.3f}s, commit_index: {indexed_time:.4f}s "
+          f"(+{index_time:.3f}s to build the index), speedup x{subprocess_time / max(indexed_time, 1e-9):.0f}")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import subprocess
+import os
+import logging
+import zlib
+from collections import OrderedDict
+import git_commit_index
+import object_store
+import git_object_reader
+from git_object_reader import blob_to_text
+
+# 相对本文件所在目录而不是当前工作目录：spawn 方式启动的进程可能在被分析的项目目录中导入本模块
+cache_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+
+
+class BlobCache(object):
+    """以 git blob id 为键的文件内容缓存：内存 LRU + 磁盘持久化，同一 blob 每个项目只从 git 读取一次"""
+
+    def __init__(self, cache_dir, commit_index=None, repo_path=None, max_memory_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.commit_index = commit_index
+        self.repo_path = repo_path
+        self.max_memory_bytes = max_memory_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        # commit -> {path: (old_blob_id, new_blob_id)}，用于不在 commit_index 中的 commit
+        self.diff_tree_blobs = {}
+        self.git_reads = 0
+        self.store = object_store.ObjectStore(os.path.join(self.cache_dir, "objects"))
+
+    def _remember(self, blob_id, data):
+        if blob_id in self.memory:
+            self.memory.move_to_end(blob_id)
+            return
+        self.memory[blob_id] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    def _read_disk(self, blob_id):
+        try:
+            return self.store.read(blob_id)
+        except (OSError, zlib.error):
+            return None
+
+    def _write_disk(self, blob_id, data):
+        self.store.write(blob_id, data)
+
+    def get_blobs(self, blob_ids):
+        """批量获取原始内容（bytes），依次查询内存、磁盘，剩余的通过一次 cat-file --batch 流水线读取"""
+        results = {}
+        missing = []
+        for blob_id in blob_ids:
+            if blob_id is None or blob_id in results or blob_id in missing:
+                continue
+            data = self.memory.get(blob_id)
+            if data is not None:
+                self.memory.move_to_end(blob_id)
+            else:
+                data = self._read_disk(blob_id)
+                if data is None:
+                    missing.append(blob_id)
+                    continue
+                self._remember(blob_id, data)
+            results[blob_id] = data
+        if missing:
+            reader = git_object_reader.get_reader(self.repo_path)
+            for blob_id, data in zip(missing, reader.get_objects(missing)):
+                if data is None:
+                    logging.error(f"Error reading blob {blob_id}")
+                    continue
+                self.git_reads += 1
+                self._write_disk(blob_id, data)
+                self._remember(blob_id, data)
+                results[blob_id] = data
+        return [results.get(blob_id) for blob_id in blob_ids]
+
+    def get_blob(self, blob_id):
+        """按 blob id 获取原始内容（bytes）"""
+        return self.get_blobs([blob_id])[0]
+
+    def _ls_tree_blob(self, revision, file_path):
+        command = ["git", "ls-tree", "--full-tree", revision, "--", file_path]
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, check=True)
+        except subprocess.CalledProcessError as e:
+            logging.error(f"Error running command {' '.join(command)}: {e}")
+            return None
+        # <mode> blob <blob_id>\t<path>
+        meta = result.stdout.split("\t")[0].split()
+        if len(meta) != 3 or meta[1] != "blob":
+            return None
+        return meta[2]
+
+    def resolve(self, commit_hash, file_path):
+        """解析 commit 前后该文件对应的 (old_blob_id, new_blob_id)"""
+        if self.commit_index is not None:
+            blob_ids = self.commit_index.get_blob_ids(commit_hash, file_path)
+            if blob_ids is not None:
+                return blob_ids
+        if commit_hash not in self.diff_tree_blobs:
+            blobs = {}
+            command = ["git", "diff-tree", "--no-commit-id", "-r", "--raw", "--no-abbrev", commit_hash]
+            try:
+                output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            except subprocess.CalledProcessError as e:
+                logging.error(f"Error running command {' '.join(command)}: {e}")
+                output = ""
+            for line in output.split("\n"):
+                if line.startswith(":"):
+                    _, path, old_blob, new_blob = git_commit_index.parse_raw_line(line)
+                    blobs[path] = (old_blob, new_blob)
+            self.diff_tree_blobs[commit_hash] = blobs
+        blob_ids = self.diff_tree_blobs[commit_hash].get(file_path)
+        if blob_ids is not None:
+            return blob_ids
+        # 该 commit 没有修改此文件（例如 merge commit），直接查询两侧的树
+        return self._ls_tree_blob(f"{commit_hash}^", file_path), self._ls_tree_blob(commit_hash, file_path)
+
+    def get_file_contents(self, requests):
+        """批量版本的 get_file_content：[(commit, path), ...] -> [(old, new) 或 None, ...]"""
+        blob_pairs = [self.resolve(commit_hash, file_path) for commit_hash, file_path in requests]
+        datas = self.get_blobs([blob_id for pair in blob_pairs for blob_id in pair])
+        contents = []
+        for i in range(len(blob_pairs)):
+            old_file_content = blob_to_text(datas[2 * i])
+            new_file_content = blob_to_text(datas[2 * i + 1])
+            if old_file_content is None and new_file_content is None:
+                contents.append(None)
+            else:
+                contents.append((old_file_content, new_file_content))
+        return contents
+
+    def get_file_content(self, commit_hash, file_path):
+        """与 get_modified_files.get_file_content 的返回一致"""
+        return self.get_file_contents([(commit_hash, file_path)])[0]
+
+
+def open_blob_cache(project_path, commit_index=None):
+    """每个项目一个缓存目录：cache/<项目名>"""
+    cache_dir = os.path.join(cache_folder, os.path.basename(os.path.normpath(project_path)))
+    return BlobCache(cache_dir, commit_index, project_path)
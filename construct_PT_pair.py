@@ -1,14 +1,19 @@
 import json
 import os
+import argparse
 import get_modified_files
 import find_commit_hash_in_range
-import save_git_log_to_file
-import parse_git_log
 import re
 from tqdm import tqdm
 import logging
 import subprocess
+import multiprocessing
 import handle_git_log
+import git_commit_index
+import blob_cache
+import sample_writer
+import content_store
+import test_path_index
 
 logging.basicConfig(filename="debug.log", level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 temp_folder = "temp"
@@ -92,109 +97,295 @@ def save_PT_pair(json_block, output_file_path):
         file.write(json_str + '\n')  # 追加json字符串并换行
 
 
-def construct_PT_pair(project_path, output_dir, commit_info_list):
+def collect_PT_pairs(tag, commit_hash, related_commits, product_files_paths, commit_index=None, blob_cache=None, path_index=None):
+    # 在related_commits中查找与product_files_paths对应的test文件修改，构造tag类型的样本
+    if related_commits is None:
+        return []
+    if path_index is None:
+        path_index = test_path_index.TestPathIndex(product_files_paths)
+    matched_pairs = []
+    for related_commit in related_commits:
+        related_changed_files = get_modified_files.get_changed_files(related_commit, commit_index)
+        matched = path_index.match(related_changed_files)
+        if not matched:
+            continue
+        for product_files_path in product_files_paths:
+            filter_changed_files = matched.get(product_files_path, "")
+            if filter_changed_files != "":
+                matched_pairs.append((related_commit, product_files_path, filter_changed_files))
+    if not matched_pairs:
+        return []
+
+    # 所有样本需要的文件版本一次性批量读取
+    requests = []
+    for related_commit, product_files_path, filter_changed_files in matched_pairs:
+        requests.append((commit_hash, product_files_path))
+        requests.append((related_commit, filter_changed_files))
+    contents = get_modified_files.get_file_contents(requests, blob_cache)
+
+    samples = []
+    for i, (related_commit, product_files_path, filter_changed_files) in enumerate(matched_pairs):
+        product_old_content, product_new_content = contents[2 * i] or (None, None)
+        test_old_content, test_new_content = contents[2 * i + 1] or (None, None)
+        # if gumtree_filter(product_old_content, product_new_content) and gumtree_filter(test_old_content, test_new_content):
+        samples.append({
+            "tag": tag,
+            "product_commit": commit_hash,
+            "test_commit": related_commit,
+            "product_file_path": product_files_path,
+            "test_file_path": filter_changed_files,
+            "product_old_content": product_old_content,
+            "product_new_content": product_new_content,
+            "test_old_content": test_old_content,
+            "test_new_content": test_new_content
+        })
+    return samples
+
+
+def construct_commit_PT_pairs(commit_hash, commit_index=None, blob_cache=None, related_filter=None, test_path_rules=None):
+    # 构造单个commit的全部正/负样本，返回 (positive_samples, negative_samples)
+    # related_filter: 若不为None，则只与其中的commit构造样本（增量更新时只考虑新commit）
+    # 获取该commit下的所有修改文件
+    changed_files_paths = get_modified_files.get_changed_files(commit_hash, commit_index)
+    # with open("/Users/mac/Desktop/TestEvolution/changed_files.txt", "a") as file:
+    #     file.write(commit_hash + "\n")
+    #     for changed_files_path in changed_files_paths:
+    #         file.write(changed_files_path + "\n")
+    #     file.write("\n")
+    # print(len(changed_files_paths))
+    # 过滤出product code文件
+    product_files_paths = list(filter(product_code_filter, changed_files_paths))
+    # print(len(product_files_paths))
+    if len(product_files_paths) == 0:
+        return [], []
+
+    # 获取该commit之后12个小时内的commit
+    positive_related_commits = find_commit_hash_in_range.find_commits(commit_hash, 0, 12, commit_index=commit_index)
+    # 获取该commit之后12小时到480小时内的commit，468=480-12
+    negative_related_commits = find_commit_hash_in_range.find_commits(commit_hash, 12, 468, commit_index=commit_index)
+    # 对于每个product code文件，获取其相关的test code文件，
+    # 12h以内全部为正样本，12h到480h为负样本，不考虑product与test文件的对应关系（后续筛选会处理）
+    # save_PT_pair({"origin": commit_hash, "positive": positive_related_commits, "negative": negative_related_commits}, "/home/yeren/TestEvolution/commits.json")
+    if related_filter is not None:
+        if positive_related_commits is not None:
+            positive_related_commits = [commit for commit in positive_related_commits if commit in related_filter]
+        if negative_related_commits is not None:
+            negative_related_commits = [commit for commit in negative_related_commits if commit in related_filter]
+    # product -> test 路径的映射在每个origin commit上只计算一次，正负样本共用
+    path_index = test_path_index.TestPathIndex(product_files_paths, test_path_rules)
+    positive_samples = collect_PT_pairs("positive", commit_hash, positive_related_commits, product_files_paths, commit_index, blob_cache, path_index)
+    negative_samples = collect_PT_pairs("negative", commit_hash, negative_related_commits, product_files_paths, commit_index, blob_cache, path_index)
+    return positive_samples, negative_samples
+
+
+# 并行模式下每个worker进程各自持有的commit索引与blob缓存（git读取进程在各自进程中启动）
+worker_state = {}
+
+def init_worker(project_path, commit_index, test_path_rules=None):
+    os.chdir(project_path)
+    worker_state["commit_index"] = commit_index
+    worker_state["blob_cache"] = blob_cache.open_blob_cache(project_path, commit_index)
+    worker_state["test_path_rules"] = test_path_rules
+
+def construct_commit_PT_pairs_worker(commit_hash):
+    return construct_commit_PT_pairs(commit_hash, worker_state["commit_index"], worker_state["blob_cache"],
+                                     test_path_rules=worker_state["test_path_rules"])
+
+
+def load_checkpoint(output_dir):
+    checkpoint_path = os.path.join(output_dir, "checkpoint.json")
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'r') as file:
+        return json.load(file)
+
+def save_checkpoint(output_dir, checkpoint):
+    # 先写临时文件再替换，保证checkpoint.json始终是完整的
+    checkpoint_path = os.path.join(output_dir, "checkpoint.json")
+    temp_path = checkpoint_path + ".tmp"
+    with open(temp_path, 'w') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+
+def load_state(output_dir):
+    state_path = os.path.join(output_dir, "state.json")
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r') as file:
+        return json.load(file)
+
+def save_state(output_dir, state):
+    with open(os.path.join(output_dir, "state.json"), 'w') as file:
+        json.dump(state, file)
+
+
+def construct_PT_pair(project_path, output_dir, commit_info_list, commit_index=None, batch_size=100, max_shard_bytes=None, normalized=False,
+                      workers=1, chunksize=16, resume=False, checkpoint_interval=50, test_path_rules=None):
+    # 输出目录按切换到项目目录之前的工作目录解析
+    output_dir = os.path.abspath(output_dir)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     if commit_info_list is None:
         return
-        
-    # 切换至对应的项目目录
-    os.chdir(project_path)
+
+    # 一次性读取完整历史，后续的修改文件与时间查询都在内存中完成
+    if commit_index is None:
+        commit_index = git_commit_index.build_commit_index(project_path)
+    samples_path = os.path.join(output_dir, "samples.jsonl")
+    commit_hashes = [commit_info['commit'].split(' ')[-1] for commit_info in commit_info_list]
     # 遍历从该项目下获取的每个commit
+    processed = 0
     positive_total = 0
     negative_total = 0
-    for commit_info in tqdm(commit_info_list):
-        # print(f"Processing commit {commit_hash}")
-        commit_hash = commit_info['commit']
-        commit_hash = commit_hash.split(' ')[-1]
-        # 获取该commit下的所有修改文件
-        changed_files_paths = get_modified_files.get_changed_files(commit_hash)
-        # with open("/Users/mac/Desktop/TestEvolution/changed_files.txt", "a") as file:
-        #     file.write(commit_hash + "\n")
-        #     for changed_files_path in changed_files_paths:
-        #         file.write(changed_files_path + "\n")
-        #     file.write("\n")
-        # print(len(changed_files_paths))
-        # 过滤出product code文件
-        product_files_paths = list(filter(product_code_filter, changed_files_paths))
-        # print(len(product_files_paths))
-
-        if len(product_files_paths) > 0:
-            # 获取该commit之后12个小时内的commit
-            positive_related_commits = find_commit_hash_in_range.find_commits(commit_hash, 0, 12)
-            # 获取该commit之后12小时到480小时内的commit，468=480-12
-            negative_related_commits = find_commit_hash_in_range.find_commits(commit_hash, 12, 468)
-            # 对于每个product code文件，获取其相关的test code文件，
-            # 12h以内全部为正样本，12h到480h为负样本，不考虑product与test文件的对应关系（后续筛选会处理）
-            # save_PT_pair({"origin": commit_hash, "positive": positive_related_commits, "negative": negative_related_commits}, "/home/yeren/TestEvolution/commits.json")
-            
-            if positive_related_commits is not None:
-                for positive_related_commit in positive_related_commits:
-                    related_changed_files = get_modified_files.get_changed_files(positive_related_commit)
-                    for product_files_path in product_files_paths:
-                        filter_changed_files = ""
-                        for related_changed_file in related_changed_files:
-                            if test_product_code_filter(related_changed_file, product_files_path):
-                                filter_changed_files = related_changed_file
-                                break
-                        if filter_changed_files != "":
-                            # print("find a positive sample")
-                            positive_total += 1
-                            product_old_content, product_new_content = get_modified_files.get_file_content(commit_hash, product_files_path)
-                            test_old_content, test_new_content = get_modified_files.get_file_content(positive_related_commit, filter_changed_files)
-                            # if gumtree_filter(product_old_content, product_new_content) and gumtree_filter(test_old_content, test_new_content):
-                            json_block = {
-                                "tag": "positive",
-                                "product_commit": commit_hash,
-                                "test_commit": positive_related_commit,
-                                "product_file_path": product_files_path,
-                                "test_file_path": filter_changed_files,
-                                "product_old_content": product_old_content,
-                                "product_new_content": product_new_content,
-                                "test_old_content": test_old_content,
-                                "test_new_content": test_new_content
-                            }
-                            save_PT_pair(json_block, os.path.join(output_dir, "samples.jsonl"))
-                        
-            if negative_related_commits is not None:
-                for negative_related_commit in negative_related_commits:
-                    related_changed_files = get_modified_files.get_changed_files(negative_related_commit)
-                    for product_files_path in product_files_paths:
-                        filter_changed_files = ""
-                        for related_changed_file in related_changed_files:
-                            if test_product_code_filter(related_changed_file, product_files_path):
-                                filter_changed_files = related_changed_file
-                                break
-                        if filter_changed_files != "":
-                            # print("find a negative sample")
-                            negative_total += 1
-                            product_old_content, product_new_content = get_modified_files.get_file_content(commit_hash, product_files_path)
-                            test_old_content, test_new_content = get_modified_files.get_file_content(negative_related_commit, filter_changed_files)
-                            json_block = {
-                                "tag": "negative",
-                                "product_commit": commit_hash,
-                                "test_commit": negative_related_commit,
-                                "product_file_path": product_files_path,
-                                "test_file_path": filter_changed_files,
-                                "product_old_content": product_old_content,
-                                "product_new_content": product_new_content,
-                                "test_old_content": test_old_content,
-                                "test_new_content": test_new_content
-                            }
-                            save_PT_pair(json_block, os.path.join(output_dir, "samples.jsonl"))
-                        
+    if resume:
+        # 从上次的checkpoint继续：截掉checkpoint之后写入的样本（包括写了一半的记录），跳过已处理的commit
+        checkpoint = load_checkpoint(output_dir)
+        if checkpoint is not None and checkpoint["processed"] > 0 and commit_hashes[checkpoint["processed"] - 1] != checkpoint["last_commit"]:
+            logging.error(f"Checkpoint in {output_dir} does not match the commit list, starting over")
+            checkpoint = None
+        if checkpoint is None:
+            sample_writer.truncate_shards(samples_path, 0, 0)
+        else:
+            sample_writer.truncate_shards(samples_path, checkpoint["shard"], checkpoint["offset"])
+            processed = checkpoint["processed"]
+            positive_total = checkpoint["positive_total"]
+            negative_total = checkpoint["negative_total"]
+            print(f"Resuming from commit {processed}/{len(commit_hashes)}: {checkpoint['last_commit']}")
+    remaining_hashes = commit_hashes[processed:]
+
+    # 样本文件保持打开，按批写入，可按大小切分为多个分片
+    writer = sample_writer.SampleWriter(samples_path, batch_size, max_shard_bytes)
+    # 规范化格式：文件内容按 blob id 去重存入 contents/，样本中只记录 blob id
+    store = content_store.ContentStore(content_store.store_dir_for(samples_path)) if normalized else None
+
+    def write_checkpoint():
+        shard, offset = writer.checkpoint()
+        save_checkpoint(output_dir, {
+            "processed": processed,
+            "last_commit": commit_hashes[processed - 1] if processed > 0 else None,
+            "positive_total": positive_total,
+            "negative_total": negative_total,
+            "shard": shard,
+            "offset": offset
+        })
+
+    pool = None
+    if workers > 1:
+        # 在切换到项目目录之前创建进程池：spawn 方式启动的进程会在父进程当前的工作目录中重新导入本模块
+        pool = multiprocessing.Pool(workers, initializer=init_worker, initargs=(project_path, commit_index, test_path_rules))
+
+    try:
+        # 切换至对应的项目目录
+        os.chdir(project_path)
+        if pool is not None:
+            # 按chunksize将commit列表分片给各个worker，imap保证结果按原顺序返回，输出与顺序执行完全一致
+            results = pool.imap(construct_commit_PT_pairs_worker, remaining_hashes, chunksize)
+        else:
+            project_blob_cache = blob_cache.open_blob_cache(project_path, commit_index)
+            results = (construct_commit_PT_pairs(commit_hash, commit_index, project_blob_cache, test_path_rules=test_path_rules)
+                       for commit_hash in remaining_hashes)
+        for positive_samples, negative_samples in tqdm(results, total=len(remaining_hashes)):
+            positive_total += len(positive_samples)
+            negative_total += len(negative_samples)
+            for json_block in positive_samples + negative_samples:
+                if store is not None:
+                    json_block = content_store.normalize_sample(json_block, store)
+                writer.write(json_block)
+            processed += 1
+            if processed % checkpoint_interval == 0:
+                write_checkpoint()
+        write_checkpoint()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        writer.close()
+    # 记录本次处理到的HEAD，供增量更新使用
+    if commit_index is not None and len(commit_index) > 0:
+        save_state(output_dir, {"head": commit_index.commits[0].hash})
     print(f"positive_total: {positive_total}")
     print(f"negative_total: {negative_total}")
 
 
+def update_PT_pair(project_path, output_dir, batch_size=100, max_shard_bytes=None, normalized=False, test_path_rules=None):
+    # 增量更新：只处理上次记录的HEAD之后新增的commit，以及负样本窗口可能覆盖到新commit的旧commit
+    output_dir = os.path.abspath(output_dir)
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    os.chdir(project_path)
+    commit_index = git_commit_index.build_commit_index(project_path)
+    if commit_index is None:
+        return
+    state = load_state(output_dir)
+    if state is None or state["head"] not in commit_index:
+        # 没有可用的历史记录，退化为完整构建；先清空已有的样本和checkpoint，否则重新构建的样本会追加在旧样本之后
+        print(f"No usable state.json in {output_dir}, rebuilding all samples")
+        sample_writer.truncate_shards(os.path.join(output_dir, "samples.jsonl"), 0, 0)
+        checkpoint_path = os.path.join(output_dir, "checkpoint.json")
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        commit_info_list = json.loads(handle_git_log.handle_git_log(project_path))
+        return construct_PT_pair(project_path, output_dir, commit_info_list, commit_index, batch_size, max_shard_bytes, normalized,
+                                 test_path_rules=test_path_rules)
 
-if __name__ == "__main__":
+    known_commits = commit_index.ancestors(state["head"])
+    new_commits = set(commit.hash for commit in commit_index.commits if commit.hash not in known_commits)
+    if not new_commits:
+        print(f"No new commits since {state['head']}")
+        return
+    # 负样本窗口为commit之后的[12h, 468h]，因此只有提交时间不早于(最早的新commit - 468h)的旧commit可能受影响
+    earliest_time = min(commit_index.get_commit(commit_hash).commit_time for commit_hash in new_commits) - 468 * 3600
+    origin_commits = [commit.hash for commit in commit_index.commits
+                      if commit.hash in new_commits or commit.commit_time >= earliest_time]
 
+    project_blob_cache = blob_cache.open_blob_cache(project_path, commit_index)
+    samples_path = os.path.join(output_dir, "samples.jsonl")
+    store = content_store.ContentStore(content_store.store_dir_for(samples_path)) if normalized else None
+    positive_total = 0
+    negative_total = 0
+    with sample_writer.SampleWriter(samples_path, batch_size, max_shard_bytes) as writer:
+        for commit_hash in tqdm(origin_commits):
+            # 旧commit与旧commit之间的样本已经存在，只补充与新commit构成的样本
+            related_filter = None if commit_hash in new_commits else new_commits
+            positive_samples, negative_samples = construct_commit_PT_pairs(commit_hash, commit_index, project_blob_cache, related_filter,
+                                                                           test_path_rules)
+            positive_total += len(positive_samples)
+            negative_total += len(negative_samples)
+            for json_block in positive_samples + negative_samples:
+                if store is not None:
+                    json_block = content_store.normalize_sample(json_block, store)
+                writer.write(json_block)
+    save_state(output_dir, {"head": commit_index.commits[0].hash})
+    print(f"new commits: {len(new_commits)}")
+    print(f"positive_total: {positive_total}")
+    print(f"negative_total: {negative_total}")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
     # project_path = "/Users/mac/Desktop/Java"
     # project_path = "/Users/mac/Desktop/commons-math" # mac
-    project_path = "/home/yeren/java-project/jfreechart"
-    commit_hash_list = json.loads(handle_git_log.handle_git_log(project_path))
+    parser.add_argument("--project_path", default="/home/yeren/java-project/jfreechart")
     # output_dir = "/Users/mac/Desktop/TestEvolution/common-math_output" # mac
-    output_dir = "/home/yeren/TestEvolution/jfreechart_output"
-    construct_PT_pair(project_path, output_dir, commit_hash_list)
+    parser.add_argument("--output_dir", default="/home/yeren/TestEvolution/jfreechart_output")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--normalized", action="store_true", help="store file contents once in <output_dir>/contents")
+    parser.add_argument("--resume", action="store_true", help="continue from <output_dir>/checkpoint.json")
+    parser.add_argument("--incremental", action="store_true", help="only process commits added since the last run")
+    parser.add_argument("--extended_test_paths", action="store_true", help="also match *Tests.java, *IT.java and tests in other modules")
+    args = parser.parse_args()
+
+    project_path = args.project_path
+    output_dir = args.output_dir
+    test_path_rules = test_path_index.EXTENDED_TEST_PATH_RULES if args.extended_test_paths else None
+    if args.incremental:
+        update_PT_pair(project_path, output_dir, normalized=args.normalized, test_path_rules=test_path_rules)
+    else:
+        commit_hash_list = json.loads(handle_git_log.handle_git_log(project_path))
+        construct_PT_pair(project_path, output_dir, commit_hash_list, normalized=args.normalized, workers=args.workers, resume=args.resume,
+                          test_path_rules=test_path_rules)
     # print(gumtree_filter(a, b))
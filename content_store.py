@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+import object_store
+import sample_writer
+
+# 样本中内联文件内容的字段，以及规范化格式中对应的 blob id 字段
+CONTENT_FIELDS = ["product_old_content", "product_new_content", "test_old_content", "test_new_content"]
+BLOB_FIELDS = {field: field.replace("_content", "_blob") for field in CONTENT_FIELDS}
+
+
+def blob_id(text):
+    """与 git hash-object 相同的计算方式：sha1("blob <size>\\0" + 内容)"""
+    data = text.encode("utf-8")
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+class ContentStore(object):
+    """blob id -> 文本 的压缩存储，相同内容只保存一份"""
+
+    def __init__(self, store_dir, max_memory_entries=256):
+        self.store_dir = store_dir
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.store = object_store.ObjectStore(self.store_dir)
+
+    def __getstate__(self):
+        # 样本被发送到其他进程时不携带内存缓存
+        state = self.__dict__.copy()
+        state["memory"] = OrderedDict()
+        return state
+
+    def put(self, text):
+        """保存文本并返回其 blob id，None 原样返回 None"""
+        if text is None:
+            return None
+        content_id = blob_id(text)
+        if content_id not in self.memory and not self.store.contains(content_id):
+            self.store.write(content_id, text.encode("utf-8"))
+        return content_id
+
+    def get(self, content_id):
+        if content_id is None:
+            return None
+        text = self.memory.get(content_id)
+        if text is not None:
+            self.memory.move_to_end(content_id)
+            return text
+        text = self.store.read(content_id).decode("utf-8")
+        self.memory[content_id] = text
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+        return text
+
+
+def normalize_sample(json_block, store):
+    """将样本中的文件内容存入 store，返回只包含 blob id 的轻量记录"""
+    record = {}
+    for key, value in json_block.items():
+        if key in BLOB_FIELDS:
+            record[BLOB_FIELDS[key]] = store.put(value)
+        else:
+            record[key] = value
+    return record
+
+
+class LazySample(dict):
+    """规范化格式的样本，首次访问 *_content 字段时才从 store 读取内容"""
+
+    def __init__(self, record, store):
+        super().__init__(record)
+        self.store = store
+
+    def __missing__(self, key):
+        for field, blob_field in BLOB_FIELDS.items():
+            if key == field and blob_field in self:
+                value = self.store.get(dict.__getitem__(self, blob_field))
+                self[key] = value
+                return value
+        raise KeyError(key)
+
+    def to_dict(self):
+        """还原为内联文件内容的普通样本"""
+        json_block = {}
+        for key in list(self.keys()):
+            if key in BLOB_FIELDS:
+                continue
+            content_key = key.replace("_blob", "_content")
+            if key.endswith("_blob") and content_key in BLOB_FIELDS:
+                json_block[content_key] = self[content_key]
+            else:
+                json_block[key] = self[key]
+        return json_block
+
+
+def store_dir_for(samples_path):
+    """规范化输出的内容存储与 samples.jsonl 放在同一目录下"""
+    return os.path.join(os.path.dirname(samples_path), "contents")
+
+
+def read_samples(samples_path):
+    """逐条读取 samples.jsonl（包括所有分片），规范化格式的记录以 LazySample 返回"""
+    store = None
+    for shard_path in sample_writer.list_shards(samples_path):
+        with open(shard_path, 'r') as file:
+            for line in file:
+                record = json.loads(line.strip())
+                if BLOB_FIELDS["product_old_content"] in record:
+                    if store is None:
+                        store = ContentStore(store_dir_for(samples_path))
+                    yield LazySample(record, store)
+                else:
+                    yield record
@@ -1,3 +1,5 @@
+import line_index
+
 a = """/*
  * Licensed to the Apache Software Foundation (ASF) under one or more
  * contributor license agreements.  See the NOTICE file distributed with
@@ -585,10 +587,7 @@ b = "/*\n * Licensed to the Apache Software Foundation (ASF) under one or more\n
 
 
 def line_col_to_char_index(text, start_line, start_column, end_line, end_column):
-    lines = text.split('\n')
-    start_index = sum(len(lines[i]) + 1 for i in range(start_line - 1)) + start_column - 1
-    end_index = sum(len(lines[i]) + 1 for i in range(end_line - 1)) + end_column - 1
-    return start_index, end_index
+    return line_index.line_index_for(text).span(start_line, start_column, end_line, end_column, clamp=False)
 
 start_index, end_index  = line_col_to_char_index(b, 367, 0, 582, 2)
 
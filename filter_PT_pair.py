@@ -1,15 +1,31 @@
 import json
+import argparse
 import subprocess
 import logging
+import logging.handlers
 import find_commit_hash_in_range
 import get_modified_files
-import re
+import git_commit_index
+import content_store
+import sample_writer
+import gumtree_client
+import gumtree_actions
+import prefilter
+import line_index
+import interval_index
+import java_identifiers
+import action_cache as gumtree_action_cache
+from refactoring_cache import open_refactoring_cache
 import os
+import itertools
+import multiprocessing
+import multiprocessing.util
+from collections import Counter
+import shutil
+import tempfile
 from tqdm import tqdm
 
 temp_folder = "temp"
-p2n = 0
-n2p = 0
 logging.basicConfig(filename="filter_PT_pair.log", level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 
@@ -29,48 +45,49 @@ def read_json_low(file):
     return data
 
 def read_json(file_path):
-    PT_pairs = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            PT_pairs.append(json.loads(line.strip()))
-    return PT_pairs
+    # samples.jsonl 可能被 SampleWriter 切分为多个分片，逐条读取，规范化格式的样本按需读取文件内容
+    return content_store.read_samples(file_path)
 
 def extract_start_end_line(text):
-    pattern = r"\[(\d+),(\d+)\]"
-    # Search for the pattern in the text
-    match = re.search(pattern, text)
-    # Extract the last two numbers if the pattern is found
-    if match:
-        start_line, end_line = match.groups()
-        return int(start_line), int(end_line)
-    else:
-        return None, None
+    # 取节点字符串中第一个 [起始下标,结束下标]，没有时返回 (None, None)
+    return gumtree_actions.extract_range(text)
     
 
-def related_files_between_commits(old_commit, new_commit, project_path, product_file_path, test_file_path):
+def related_files_between_commits(old_commit, new_commit, project_path, product_file_path, test_file_path, commit_index=None):
     # 判断两个commit之间是否有其他commit修改了生产/测试相关的文件
     # 如果有，则返回True；否则返回False
     # 若只需要判断生产/测试其中之一，则将另一个参数置为“”(空字符串)
+    # 时间窗口为两个commit提交时间之间的完整区间（包括跨越多天的情况）
     if old_commit == new_commit:
         return False
+    if commit_index is not None and old_commit in commit_index and new_commit in commit_index:
+        # 使用 commit_index 中 文件路径 -> commit 的倒排索引，二分查找代替逐个 commit 查询修改文件
+        old_time = commit_index.get_commit(old_commit).commit_time
+        new_time = commit_index.get_commit(new_commit).commit_time
+        since, until = min(old_time, new_time), max(old_time, new_time)
+        for file_path in (product_file_path, test_file_path):
+            if file_path and commit_index.path_changed_between(file_path, since, until, (old_commit, new_commit)):
+                return True
+        return test_file_path in commit_index.get_changed_files(old_commit) \
+            or product_file_path in commit_index.get_changed_files(new_commit)
     current_path = os.getcwd()
     os.chdir(project_path)
-    old_time = find_commit_hash_in_range.get_commit_date(old_commit)
-    new_time = find_commit_hash_in_range.get_commit_date(new_commit)
-    related_commits = find_commit_hash_in_range.find_commits(old_commit, 0, (new_time - old_time).seconds / 3600)
+    old_time = find_commit_hash_in_range.get_commit_date(old_commit, commit_index)
+    new_time = find_commit_hash_in_range.get_commit_date(new_commit, commit_index)
+    related_commits = find_commit_hash_in_range.find_commits_after_date(min(old_time, new_time), max(old_time, new_time))
     if old_commit in related_commits:
         related_commits.remove(old_commit)
     if new_commit in related_commits:
         related_commits.remove(new_commit)
     for commit in related_commits:
-        changed_files = get_modified_files.get_changed_files(commit)
+        changed_files = get_modified_files.get_changed_files(commit, commit_index)
         for file in changed_files:
             if product_file_path == file or test_file_path == file:
                 os.chdir(current_path)
                 return True
     # 对old_commit和new_commit单独进行判断，观察old_commit中是否有test_file_path，new_commit中是否有product_file_path
-    old_changed_files = get_modified_files.get_changed_files(old_commit)
-    new_changed_files = get_modified_files.get_changed_files(new_commit)
+    old_changed_files = get_modified_files.get_changed_files(old_commit, commit_index)
+    new_changed_files = get_modified_files.get_changed_files(new_commit, commit_index)
     for file in old_changed_files:
         if test_file_path == file:
             os.chdir(current_path)
@@ -82,439 +99,529 @@ def related_files_between_commits(old_commit, new_commit, project_path, product_
     os.chdir(current_path)
     return False
 
-def line_col_to_char_index(text, start_line, start_column, end_line, end_column):
-    lines = text.split('\n')
-    # 确保行号不会超出文本的实际行数
-    start_line = max(1, min(start_line, len(lines)))
-    end_line = max(1, min(end_line, len(lines)))
-
-    # 计算起始索引，如果起始列超过该行的长度，则将其限制在行的最大长度
-    start_index = sum(len(lines[i]) + 1 for i in range(start_line - 1))
-    start_index += min(start_column - 1, len(lines[start_line - 1]))
-
-    # 计算结束索引，同样如果结束列超过该行的长度，则将其限制在行的最大长度
-    end_index = sum(len(lines[i]) + 1 for i in range(end_line - 1))
-    end_index += min(end_column - 1, len(lines[end_line - 1]))
-
-    return start_index, end_index
-
-
-
-def strategy_1(json_block, product_change_actions, test_change_actions, project_path):
-    # strategy 1: The type of the associated production code change or the test code change is non-modification type 
-    # and there are no production/test changes between their commits: "NEGATIVE"--> “POSITIVE.”
-    global n2p, change_type_set
-    if json_block["tag"] == "positive":
-        return 
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
-    product_old_content = json_block["product_old_content"]
-    product_new_content = json_block["product_new_content"]
-    test_old_content = json_block["test_old_content"]
-    test_new_content = json_block["test_new_content"]
+def gumtree_textdiff(old_content, new_content, work_dir):
+    # 每次启动一个 gumtree.jar 进程；输入写入本进程独占的 work_dir，结果直接从标准输出流式解析
+    old_path = os.path.join(work_dir, "old.java")
+    new_path = os.path.join(work_dir, "new.java")
+    with open(old_path, "w") as file:
+        file.write(old_content)
+    with open(new_path, "w") as file:
+        file.write(new_content)
+    command = ["java", "-jar", gumtree_client.gumtree_jar, "textdiff", old_path, new_path, "-f", "JSON"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        actions = json.load(process.stdout)["actions"]
+    except (ValueError, KeyError) as e:
+        actions = None
+        logging.error(f"Error parsing output of {' '.join(command)}: {e}")
+    process.stdout.close()
+    if process.wait() != 0:
+        logging.error(f"Error running command {' '.join(command)}: exit status {process.returncode}")
+        return None
+    return actions
+
+def gumtree_diff(differ, old_content, new_content, work_dir, cache=None):
+    # 优先使用常驻的 GumTree 服务（内容通过管道传递），不可用时退回到 gumtree_textdiff；出错时返回 None
+    # cache: ActionCache，同一对文件内容只 diff 一次（出错的结果不缓存）
+    if cache is not None:
+        actions = cache.get(old_content, new_content)
+        if actions is not None:
+            return actions
+    if differ is None:
+        actions = gumtree_textdiff(old_content, new_content, work_dir)
+    else:
+        try:
+            actions = differ.diff(old_content, new_content)["actions"]
+        except gumtree_client.GumTreeServerError as e:
+            # 服务无法启动或中途退出，本样本改用 textdiff；结果不写入按服务方式区分的缓存
+            logging.error(f"GumTree server failed, using gumtree.jar textdiff: {e}")
+            return gumtree_textdiff(old_content, new_content, work_dir)
+        except gumtree_client.GumTreeError as e:
+            logging.error(f"Error running GumTree diff: {e}")
+            actions = None
+    if cache is not None and actions is not None:
+        cache.put(old_content, new_content, actions)
+    return actions
+
+def open_differ(workers=1):
+    try:
+        differ = gumtree_client.open_pool(workers)
+        differ.start()
+        return differ
+    except gumtree_client.GumTreeError as e:
+        logging.error(f"GumTree server unavailable, falling back to gumtree.jar textdiff: {e}")
+        return None
 
-    if product_change_actions == [] or test_change_actions == []:
-        return
-    # 判断两个commit之间是否有其他commit修改了生产/测试相关的文件
-    if related_files_between_commits(product_commit, test_commit, project_path, product_file_path, test_file_path):
-        return 
-    # 判断两个文件的更改内容是否仅为添加或删除（非修改内容，也即非update和move）
-    # 注 -- gumtree的修改类型有四种：insert, delete, update, move
-    for change_action in product_change_actions:
-        change_type = change_action["action"].split("-")[0]
-        if change_type == "update" or change_type == "move":
-            return
-    for change_action in test_change_actions:
-        change_type = change_action["action"].split("-")[0]
-        if change_type == "update" or change_type == "move":
-            return
-    json_block["tag"] = "positive"
-    current_path = os.getcwd()
-    os.chdir(project_path)
-    product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-    test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-    os.chdir(current_path)
-    logging.info(f"No.{n2p + 1} negative --> positive\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-    n2p += 1
+def line_col_to_char_index(text, start_line, start_column, end_line, end_column):
+    # 行号超出文本的行数时限制在有效范围内，列号超过该行长度时限制在行的最大长度
+    # 使用按文件内容缓存的行首偏移表，不再为每个位置重新切分整个文件
+    return line_index.line_index_for(text).span(start_line, start_column, end_line, end_column)
+
+
+def log_transition(number, description, json_block, commit_infos):
+    """记录一次样本标签的变化；提交时间取自已解析的 CommitInfo，不再为写日志切换目录、调用 git
+    除了文本消息外，各字段也通过 extra 附在日志记录上"""
+    product_info, test_info = commit_infos
+    fields = {
+        "transition": description,
+        "product_commit": json_block["product_commit"],
+        "test_commit": json_block["test_commit"],
+        "product_time": product_info.commit_date if product_info is not None else None,
+        "test_time": test_info.commit_date if test_info is not None else None,
+        "product_file_path": json_block["product_file_path"],
+        "test_file_path": json_block["test_file_path"],
+    }
+    logging.info(f"No.{number} {description}\n" + "\n".join(f"{key}: {value}" for key, value in fields.items() if key != "transition"),
+                 extra=fields)
+
+
+def start_log_listener():
+    """日志改为异步写入：各进程只把记录放入队列，由后台的 QueueListener 写入 filter_PT_pair.log"""
+    root = logging.getLogger()
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    listener.start()
+    return log_queue, listener
+
+def stop_log_listener(listener):
+    listener.stop()
+    logging.getLogger().handlers = list(listener.handlers)
+
+
+class SideFeatures(object):
+    """product 或 test 一侧的修改特征，由 SampleFeatures 在一次遍历中填充"""
+
+    def __init__(self):
+        self.empty = True
+        self.update_or_move = False
+        # strategy_3：是否只修改了 import，以及修改的 import 内容
+        self.only_imports = True
+        self.imports = set()
+        # strategy_4：每个修改（父节点）在修改前/修改后文件中的范围
+        self.old_content = None
+        self.new_content = None
+        self.old_ranges = []
+        self.new_ranges = []
+        # strategy_5：是否只修改了注解/修饰符，以及其余修改的范围
+        self.only_annotations_or_modifiers = True
+        self.other_ranges = []
+        # strategy_6：是否只修改了 javadoc 文本
+        self.only_text_elements = True
+        self.identifier_cache = None
+
+    def identifiers(self):
+        """修改片段中的 Java 标识符集合（只扫描修改的范围），第一次使用时才计算"""
+        if self.identifier_cache is None:
+            self.identifier_cache = java_identifiers.identifier_set(self.old_content, self.old_ranges) \
+                | java_identifiers.identifier_set(self.new_content, self.new_ranges)
+        return self.identifier_cache
+
+
+class SampleFeatures(object):
+    """一个样本的特征缓存：解析后的 GumTree 动作只遍历一次，所有规则共享遍历结果，
+    代价较高的特征（标识符集合、两个 commit 之间的修改、重构信息）在第一次使用时才计算"""
+
+    def __init__(self, json_block, product_change_actions, test_change_actions, project_path,
+                 commit_index=None, refactoring_cache=None, commit_infos=(None, None)):
+        self.json_block = json_block
+        self.project_path = project_path
+        self.commit_index = commit_index
+        self.refactoring_cache = refactoring_cache
+        self.commit_infos = commit_infos
+        self.product = self.traverse(product_change_actions, json_block["product_old_content"], json_block["product_new_content"])
+        self.test = self.traverse(test_change_actions, json_block["test_old_content"], json_block["test_new_content"])
+        self.related_cache = {}
+
+    @staticmethod
+    def traverse(change_actions, old_content, new_content):
+        side = SideFeatures()
+        side.old_content = old_content
+        side.new_content = new_content
+        for change_action in change_actions:
+            side.empty = False
+            # insert 的位置对应修改后的文件，其余对应修改前的文件
+            content = new_content if change_action.kind == "insert" else old_content
+            if change_action.kind == "update" or change_action.kind == "move":
+                side.update_or_move = True
+            if side.only_imports:
+                if not change_action.is_import and not change_action.is_qualified_name:
+                    side.only_imports = False
+                    side.imports = set()
+                elif change_action.is_import:
+                    import_content = content[change_action.start:change_action.end]
+                    if "import" in import_content:
+                        side.imports.add(import_content)
+                elif change_action.start >= 7:
+                    import_content = content[change_action.start - 7:change_action.end + 1]
+                    if "import" in import_content:
+                        side.imports.add(import_content)
+            if change_action.parent_start is not None:
+                ranges = side.new_ranges if change_action.kind == "insert" else side.old_ranges
+                ranges.append((change_action.parent_start, change_action.parent_end))
+            if not change_action.is_annotation_or_modifier:
+                side.only_annotations_or_modifiers = False
+                side.other_ranges.append((change_action.start, change_action.end))
+            if not change_action.is_text_element:
+                side.only_text_elements = False
+        return side
+
+    def related_files_between(self, product_file_path, test_file_path):
+        """两个 commit 之间是否有其他 commit 修改了相关文件，同一样本的相同查询只计算一次"""
+        key = (product_file_path, test_file_path)
+        if key not in self.related_cache:
+            self.related_cache[key] = related_files_between_commits(
+                self.json_block["product_commit"], self.json_block["test_commit"], self.project_path,
+                product_file_path, test_file_path, self.commit_index)
+        return self.related_cache[key]
+
+
+# 注册的筛选规则，按注册顺序对标签相符的样本执行，第一个触发的规则决定结果
+# (名称, 检查函数, 适用的标签, 效果)，效果为 "flip"（翻转标签）或 "delete"（删除样本）
+RULES = []
+
+def register_rule(name, tag, effect="flip"):
+    def decorator(check):
+        RULES.append((name, check, tag, effect))
+        return check
+    return decorator
+
+
+@register_rule("strategy 6", "positive", "delete")
+def strategy_6(features):
+    # strategy 6: customize rule, remove the positive part with only comment change. "POSITIVE" --> “NEGATIVE.”
+    if features.product.empty or features.test.empty:
+        return True
+    return features.product.only_text_elements and features.test.only_text_elements
 
-def strategy_2(json_block, project_path):
+@register_rule("strategy 2", "positive")
+def strategy_2(features):
     # strategy 2: There are additional production code modifications 
     # between production code change commit and test code change commit: "POSITIVE" --> “NEGATIVE.”
-    global p2n
-    if json_block["tag"] == "negative":
-        return
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
-    product_old_content = json_block["product_old_content"]
-    product_new_content = json_block["product_new_content"]
-    test_old_content = json_block["test_old_content"]
-    test_new_content = json_block["test_new_content"]
-    if related_files_between_commits(product_commit, test_commit, project_path, product_file_path, ""):
-        json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 2\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-        p2n += 1
-
-def strategy_3(json_block, product_change_actions, test_change_actions, project_path):
+    return features.related_files_between(features.json_block["product_file_path"], "")
+
+@register_rule("strategy 3", "positive")
+def strategy_3(features):
     # strategy 3: The changes of the production or test code involve only import changes, 
     # and the intersection of import modification is empty: "POSITIVE" --> “NEGATIVE.”
-    global p2n
-    if json_block["tag"] == "negative":
-        return
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
-    product_old_content = json_block["product_old_content"]
-    product_new_content = json_block["product_new_content"]
-    test_old_content = json_block["test_old_content"]
-    test_new_content = json_block["test_new_content"]
-    product_imports = set()
-    test_imports = set()
-    for product_change_action in product_change_actions:
-        product_tree = product_change_action["tree"]
-        action = product_change_action["action"].split("-")[0]
-        if (not product_tree.startswith("ImportDeclaration")) and (not product_tree.startswith("QualifiedName")):
-            return 
-        
-        if product_tree.startswith("ImportDeclaration"):
-            start_line, end_line = extract_start_end_line(product_tree)
-            if action != "insert":
-                import_content = product_old_content[start_line:end_line]
-                if "import" in import_content:
-                    product_imports.add(import_content)
-            else:
-                import_content = product_new_content[start_line:end_line]
-                if "import" in import_content:
-                    product_imports.add(import_content)
-        if product_tree.startswith("QualifiedName"):
-            start_line, end_line = extract_start_end_line(product_tree)
-            if start_line < 7:
-                continue
-            if action != "insert":
-                import_content = product_old_content[start_line - 7:end_line + 1] 
-                if "import" in import_content:
-                    product_imports.add(import_content)
-            else:
-                import_content = product_new_content[start_line - 7:end_line + 1]
-                if "import" in import_content:
-                    product_imports.add(import_content)
-    for test_change_action in test_change_actions:
-        test_tree = test_change_action["tree"]
-        action = test_change_action["action"].split("-")[0]
-        if (not test_tree.startswith("ImportDeclaration")) and (not test_tree.startswith("QualifiedName")):
-            return
-        if test_tree.startswith("ImportDeclaration"):
-            start_line, end_line = extract_start_end_line(test_tree)
-            if action != "insert":
-                import_content = test_old_content[start_line:end_line]
-                if "import" in import_content:
-                    test_imports.add(import_content)
-            else:
-                import_content = test_new_content[start_line:end_line]
-                if "import" in import_content:
-                    test_imports.add(import_content)
-        if test_tree.startswith("QualifiedName"):
-            start_line, end_line = extract_start_end_line(test_tree)
-            if start_line < 7:
-                continue
-            if action != "insert":
-                import_content = test_old_content[start_line - 7:end_line + 1] 
-                if "import" in import_content:
-                    test_imports.add(import_content)
-            else:
-                import_content = test_new_content[start_line - 7:end_line + 1]
-                if "import" in import_content:
-                    test_imports.add(import_content)
-
-    if product_imports.intersection(test_imports) == set():
-        json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 3\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-        p2n += 1
-
-def strategy_4(json_block, product_change_actions, test_change_actions, project_path):
+    if not features.product.only_imports or not features.test.only_imports:
+        return False
+    return features.product.imports.intersection(features.test.imports) == set()
+
+@register_rule("strategy 4", "positive")
+def strategy_4(features):
     # strategy 4: There is no semantic relevance between the changes of the production and testcode. "POSITIVE" --> “NEGATIVE.”
-    global p2n
-    if json_block["tag"] == "negative":
-        return
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
-    product_old_content = json_block["product_old_content"]
-    product_new_content = json_block["product_new_content"]
-    test_old_content = json_block["test_old_content"]
-    test_new_content = json_block["test_new_content"]
+    return features.product.identifiers().isdisjoint(features.test.identifiers())
 
-    product_changes = set()
-    test_changes = set()
-    for product_change_action in product_change_actions:
-        if "parent" in product_change_action:
-            product_tree = product_change_action["parent"]
-        else:
-            product_tree = product_change_action["tree"]
-        action = product_change_action["action"].split("-")[0]
-        start_line, end_line = extract_start_end_line(product_tree)
-        if start_line is not None:
-            if action != "insert":
-                content = product_old_content[start_line:end_line]
-                product_changes.update(re.split(r'[ @\n\\/,;{}\[\]()\.\+=:"]+', content))
-            else:
-                content = product_new_content[start_line:end_line]
-                product_changes.update(re.split(r'[ @\n\\/,;{}\[\]()\.\+=:"]+', content))
-    for test_change_action in test_change_actions:
-        if "parent" in test_change_action:
-            test_tree = test_change_action["parent"]
-        else:
-            test_tree = test_change_action["tree"]
-        action = test_change_action["action"].split("-")[0]
-        start_line, end_line = extract_start_end_line(test_tree)
-        if start_line is not None:
-            if action != "insert":
-                content = test_old_content[start_line:end_line]
-                test_changes.update(re.split(r'[ @\n\\/,;{}\[\]()\.\+=:"]+', content))
-            else:
-                content = test_new_content[start_line:end_line]
-                test_changes.update(re.split(r'[ @\n\\/,;{}\[\]()\.\+=:"]+', content))
-    product_changes_set = set(product_changes)
-    test_changes_set = set(test_changes)
-    if product_changes_set.intersection(test_changes_set) == set():
-        json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 4\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-        p2n += 1
-
-def strategy_5(json_block, product_change_actions, test_change_actions, refactorings, project_path):
+@register_rule("strategy 5", "positive")
+def strategy_5(features):
     # strategy 5: The type of modification involves annotations, modifiers, and refactoring op-erations: "POSITIVE" --> “NEGATIVE.”
-    global p2n
-    if json_block["tag"] == "negative":
-        return
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
-    product_old_content = json_block["product_old_content"]
-    product_new_content = json_block["product_new_content"]
-    test_old_content = json_block["test_old_content"]
-    test_new_content = json_block["test_new_content"]
-
-    # product_changes = []
-    test_changes = []
-
-    for product_change_action in product_change_actions:
-        product_tree = product_change_action["tree"]
-        if "Annotation" in product_tree or product_tree.startswith("Modifier"):
-            continue
-        else:
-            return
-    for test_change_action in test_change_actions:
-        test_tree = test_change_action["tree"]
-        if "Annotation" in test_tree or test_tree.startswith("Modifier"):
-            continue
-        start_line, end_line = extract_start_end_line(test_tree)
-        test_changes.append((start_line, end_line))
+    if not features.product.only_annotations_or_modifiers:
+        return False
+    test_changes = features.test.other_ranges
     if test_changes == []:
-        json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 5\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-        p2n += 1
-        return
+        return True
+    # 只有走到这里才需要重构信息，RefactoringMiner 按 commit 缓存，每个 commit 只运行一次
+    refactorings = features.refactoring_cache.get(features.json_block["test_commit"])
+    if refactorings is None:
+        return False
+    # 行首偏移表对每份测试文件只建立一次
+    test_line_index = line_index.line_index_for(features.json_block["test_old_content"])
+    refactoring_spans = []
     for refactoring in refactorings:
         for location in refactoring["leftSideLocations"]:
             start_line = location["startLine"]
             end_line = location["endLine"]
             start_column = location["startColumn"]
             end_column = location["endColumn"]
-            start_index, end_index = line_col_to_char_index(test_old_content, start_line, start_column, end_line, end_column)
-            test_changes[:] = [change for change in test_changes if not (start_index <= change[0] and end_index >= change[1])]
-    if test_changes == []:
-        json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 5\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-        p2n += 1
+            refactoring_spans.append(test_line_index.span(start_line, start_column, end_line, end_column))
+    # 一次性删除被任意重构区间包含的测试修改
+    return interval_index.SpanIndex(refactoring_spans).remove_covered(test_changes) == []
+
+@register_rule("strategy 1", "negative")
+def strategy_1(features):
+    # strategy 1: The type of the associated production code change or the test code change is non-modification type 
+    # and there are no production/test changes between their commits: "NEGATIVE"--> “POSITIVE.”
+    if features.product.empty or features.test.empty:
+        return False
+    # 判断两个commit之间是否有其他commit修改了生产/测试相关的文件
+    if features.related_files_between(features.json_block["product_file_path"], features.json_block["test_file_path"]):
+        return False
+    # 判断两个文件的更改内容是否仅为添加或删除（非修改内容，也即非update和move）
+    # 注 -- gumtree的修改类型有四种：insert, delete, update, move
+    return not features.product.update_or_move and not features.test.update_or_move
 
 
-def strategy_6(json_block, product_change_actions, test_change_actions, project_path):
-    # strategy 6: customize rule, remove the positive part with only comment change. "POSITIVE" --> “NEGATIVE.”
-    global p2n
-    
-    product_commit = json_block["product_commit"]
-    test_commit = json_block["test_commit"]
-    product_file_path = json_block["product_file_path"]
-    test_file_path = json_block["test_file_path"]
+def apply_rules(features, stats):
+    """依次执行与样本标签相符的规则，第一个触发的规则生效；返回 False 表示样本被删除"""
+    json_block = features.json_block
+    tag = json_block["tag"]
+    for name, check, rule_tag, effect in RULES:
+        if rule_tag != tag or not check(features):
+            continue
+        if effect == "delete":
+            log_transition(stats["p2n"] + 1, f"positive --> negative by {name}", json_block, features.commit_infos)
+            stats["delete_number"] += 1
+            return False
+        if tag == "negative":
+            json_block["tag"] = "positive"
+            log_transition(stats["n2p"] + 1, "negative --> positive", json_block, features.commit_infos)
+            stats["n2p"] += 1
+        else:
+            json_block["tag"] = "negative"
+            log_transition(stats["p2n"] + 1, f"positive --> negative by {name}", json_block, features.commit_infos)
+            stats["p2n"] += 1
+        return True
+    return True
+
+
+def load_filter_state(output_dir):
+    state_path = os.path.join(output_dir, "filter_state.json")
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, 'r') as file:
+        return json.load(file)
+
+def save_filter_state(output_dir, state):
+    with open(os.path.join(output_dir, "filter_state.json"), 'w') as file:
+        json.dump(state, file)
+
+
+def filter_sample(json_block, stats, differ, work_dir, cache, refactoring_cache, project_path, commit_index=None, use_prefilter=True):
+    """对一个样本运行各筛选规则，返回需要保留的样本（内联文件内容的普通dict），被删除时返回None"""
     product_old_content = json_block["product_old_content"]
     product_new_content = json_block["product_new_content"]
     test_old_content = json_block["test_old_content"]
     test_new_content = json_block["test_new_content"]
-    
-    if product_old_content == None or product_new_content == None or test_old_content == None or test_new_content == None:
-        return True
-    if json_block["tag"] == "negative":
-        return False
 
-    if product_change_actions == [] or test_change_actions == []:
-        # json_block["tag"] = "negative"
-        current_path = os.getcwd()
-        os.chdir(project_path)
-        product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-        test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-        os.chdir(current_path)
-        logging.info(f"No.{p2n + 1} positive --> negative by strategy 6\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}\n")
-        
-        # p2n += 1
-        return True
+    if product_old_content == None or product_new_content == None or test_old_content == None or test_new_content == None:
+        json_block["tag"] = "negative"
+        stats["prefilter_null"] += 1
+        return None
 
-    for product_change_action in product_change_actions:
-        product_tree = product_change_action["tree"].split(":")[0]
-        if product_tree != "TextElement":
-            return False
-        
-    for test_change_action in test_change_actions:
-        test_tree = test_change_action["tree"].split(":")[0]
-        if test_tree != "TextElement":
-            return False
-        
-    # json_block["tag"] = "negative"
-    current_path = os.getcwd()
-    os.chdir(project_path)
-    product_time = find_commit_hash_in_range.get_commit_date(product_commit)
-    test_time = find_commit_hash_in_range.get_commit_date(test_commit)
-    os.chdir(current_path)  
-    logging.info(f"No.{p2n + 1} positive --> negative by strategy 6\nproduct_commit: {product_commit}\ntest_commit: {test_commit}\nproduct_time: {product_time}\ntest_time: {test_time}\nproduct_file_path: {product_file_path}\ntest_file_path: {test_file_path}")
-        
-    # p2n += 1
-    return True
+    tier = prefilter.prefilter_sample(json_block) if use_prefilter else None
+    if tier is not None:
+        # 有一侧没有 AST 修改，GumTree 的结果必然为 []：负样本由 strategy_1 保留，正样本由 strategy_6 删除
+        stats["prefilter_" + tier] += 1
+        product_change_actions = []
+        test_change_actions = []
+    else:
+        stats["gumtree_samples"] += 1
+        product_change_actions = gumtree_diff(differ, product_old_content, product_new_content, work_dir, cache)
+        if product_change_actions is None:
+            return None
+        test_change_actions = gumtree_diff(differ, test_old_content, test_new_content, work_dir, cache)
+        if test_change_actions is None:
+            return None
+        # GumTree 的结果只解析一次，各策略直接使用解析后的字段
+        product_change_actions = gumtree_actions.parse_actions(product_change_actions)
+        test_change_actions = gumtree_actions.parse_actions(test_change_actions)
+
+    # 两个 commit 的元信息（CommitInfo）只在这里解析一次，各策略写日志时直接使用
+    commit_infos = (None, None)
+    if commit_index is not None:
+        commit_infos = (commit_index.get_commit(json_block["product_commit"]), commit_index.get_commit(json_block["test_commit"]))
+
+    features = SampleFeatures(json_block, product_change_actions, test_change_actions, project_path,
+                              commit_index, refactoring_cache, commit_infos)
+    if not apply_rules(features, stats):
+        return None
+    if isinstance(json_block, content_store.LazySample):
+        return json_block.to_dict()
+    return json_block
+
+
+# 每个筛选进程独立的 GumTree 服务、临时目录、diff 缓存和 RefactoringMiner 缓存
+filter_worker_state = {}
+
+def init_filter_worker(project_path, commit_index, gumtree_server=True, action_cache=True, use_prefilter=True, log_queue=None):
+    if log_queue is not None and multiprocessing.parent_process() is not None:
+        # 进程池中的进程把日志发回主进程统一写入，避免多个进程同时写同一个文件
+        logging.getLogger().handlers = [logging.handlers.QueueHandler(log_queue)]
+    os.makedirs(temp_folder, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix="filter_", dir=os.path.abspath(temp_folder))
+    differ = open_differ() if gumtree_server else None
+    # 要求使用 GumTree 服务但无法启动时，在第一个样本的计数中报告
+    filter_worker_state["switched_to_textdiff"] = gumtree_server and differ is None
+    cache = None
+    if action_cache:
+        cache = gumtree_action_cache.open_action_cache(gumtree_client.gumtree_jar, "textdiff" if differ is None else "server")
+    filter_worker_state.update({
+        "project_path": project_path,
+        "commit_index": commit_index,
+        "work_dir": work_dir,
+        "differ": differ,
+        "cache": cache,
+        "refactoring_cache": open_refactoring_cache(project_path, work_dir),
+        "use_prefilter": use_prefilter,
+        # 本进程的累计计数，日志中的编号基于它
+        "stats": Counter(),
+    })
+    # 进程池中的进程不会执行 atexit，用 Finalize 在进程正常退出时释放资源
+    multiprocessing.util.Finalize(None, close_filter_worker, exitpriority=10)
+
+def use_textdiff(state):
+    """GumTree 服务反复启动失败时，本进程之后的样本都改用 gumtree.jar textdiff，不再启动 JVM"""
+    logging.error("GumTree server keeps failing, switching this worker to gumtree.jar textdiff")
+    state["differ"].close()
+    state["differ"] = None
+    if state["cache"] is not None:
+        state["cache"] = gumtree_action_cache.open_action_cache(gumtree_client.gumtree_jar, "textdiff")
+    state["switched_to_textdiff"] = True
+
+def close_filter_worker():
+    if filter_worker_state.get("differ") is not None:
+        filter_worker_state["differ"].close()
+        filter_worker_state["differ"] = None
+    if "work_dir" in filter_worker_state:
+        shutil.rmtree(filter_worker_state.pop("work_dir"), ignore_errors=True)
+
+def filter_sample_worker(json_block):
+    """返回 (保留的样本或None, 本样本产生的计数)"""
+    state = filter_worker_state
+    stats = state["stats"]
+    cache = state["cache"]
+    before = stats.copy()
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+    runs = state["refactoring_cache"].runs
+    result = filter_sample(json_block, stats, state["differ"], state["work_dir"], cache,
+                           state["refactoring_cache"], state["project_path"], state["commit_index"], state["use_prefilter"])
+    sample_stats = stats - before
+    if cache is not None:
+        sample_stats["action_cache_hits"] += cache.hits - hits
+        sample_stats["action_cache_misses"] += cache.misses - misses
+    sample_stats["refactoring_miner_runs"] += state["refactoring_cache"].runs - runs
+    if state["differ"] is not None and not state["differ"].available:
+        use_textdiff(state)
+    if state.pop("switched_to_textdiff", False):
+        sample_stats["gumtree_server_fallbacks"] += 1
+    return result, sample_stats
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def filter_PT_pair(input_dir, output_dir, project_path, incremental=False, gumtree_server=True, action_cache=True,
+                   refactorings_range=None, workers=1, chunksize=4, batch_size=256, use_prefilter=True, async_logging=True):
+    # incremental: 只筛选上次运行之后新追加到samples.jsonl中的样本，结果追加到已有的filter.jsonl
+    # gumtree_server: 使用常驻的GumTree服务进程，避免每个样本启动两次JVM
+    # action_cache: 缓存GumTree的diff结果，重复的文件内容对（以及重新运行时）不再diff
+    # refactorings_range: (start_commit, end_commit)，开始筛选前用RefactoringMiner -bc批量检测该范围内的重构
+    # workers: 筛选进程数，大于1时样本分发到进程池，结果仍按原顺序写入filter.jsonl
+    # batch_size: 每次读入并分发的样本数，内存占用与一批样本成正比，而不是整个数据集
+    # use_prefilter: 先用词法级别的检查判断没有 AST 修改的样本，只有无法判断的样本才调用 GumTree
+    # async_logging: 日志由后台线程写入文件，筛选过程中不等待磁盘 IO
+    samples_path = input_dir + "/samples.jsonl"
+    output_path = output_dir + "/filter.jsonl"
+    total = sample_writer.count_records(samples_path)
+    commit_index = git_commit_index.build_commit_index(project_path)
+
+    start_index = 0
+    state = load_filter_state(output_dir) if incremental else None
+    if state is not None and os.path.exists(output_path):
+        start_index = state["filtered"]
+        # 丢弃上次运行在保存状态之后追加的不完整结果
+        sample_writer.truncate_shards(output_path, state["shard"], state["offset"])
+        print(f"Skipping {start_index} samples filtered by the previous run")
+    else:
+        for path in sample_writer.list_shards(output_path):
+            os.remove(path)
+
+    if refactorings_range is not None:
+        os.makedirs(temp_folder, exist_ok=True)
+        work_dir = tempfile.mkdtemp(prefix="filter_", dir=os.path.abspath(temp_folder))
+        print(f"Precomputed refactorings for {open_refactoring_cache(project_path, work_dir).precompute(*refactorings_range)} commits")
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    log_queue, listener = start_log_listener() if async_logging else (None, None)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=init_filter_worker,
+                                    initargs=(project_path, commit_index, gumtree_server, action_cache, use_prefilter, log_queue))
+    else:
+        init_filter_worker(project_path, commit_index, gumtree_server, action_cache, use_prefilter)
 
+    stats = Counter()
+    filtered = start_index
+    samples = itertools.islice(read_json(samples_path), start_index, None)
+    progress = tqdm(total=total - start_index)
+    try:
+        with sample_writer.SampleWriter(output_path, batch_size) as writer:
+            for batch in batched(samples, batch_size):
+                if pool is not None:
+                    # imap 按输入顺序返回结果；按批提交，避免一次把所有样本放入任务队列
+                    results = pool.imap(filter_sample_worker, batch, chunksize)
+                else:
+                    results = map(filter_sample_worker, batch)
+                for result, sample_stats in results:
+                    stats.update(sample_stats)
+                    if result is not None:
+                        writer.write(result)
+                    progress.update(1)
+                filtered += len(batch)
+            shard, offset = writer.checkpoint()
+    finally:
+        progress.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
+        else:
+            close_filter_worker()
+        if listener is not None:
+            stop_log_listener(listener)
+    save_filter_state(output_dir, {"filtered": filtered, "shard": shard, "offset": offset})
+
+    print("p2n: ", stats["p2n"])
+    print("n2p: ", stats["n2p"])
+    print("delete_number: ", stats["delete_number"])
+    print("prefilter: ", ", ".join(f"{tier} {stats['prefilter_' + tier]}" for tier in ["null"] + prefilter.TIERS),
+          f"-> {stats['gumtree_samples']} samples sent to GumTree")
+    if action_cache:
+        print(gumtree_action_cache.format_report(stats["action_cache_hits"], stats["action_cache_misses"]))
+    print("RefactoringMiner runs: ", stats["refactoring_miner_runs"])
+    if stats["gumtree_server_fallbacks"]:
+        print(f"GumTree server unavailable in {stats['gumtree_server_fallbacks']} worker(s), used gumtree.jar textdiff instead (see filter_PT_pair.log)")
+
+
+def export_pretty(output_dir):
+    """将 filter.jsonl 逐条转换为缩进格式的 filter.json（与原来 json.dump(..., indent=4) 的输出相同）"""
+    with open(output_dir + "/filter.json", 'w') as file:
+        count = 0
+        for json_block in content_store.read_samples(output_dir + "/filter.jsonl"):
+            file.write("[\n" if count == 0 else ",\n")
+            file.write("\n".join("    " + line for line in json.dumps(json_block, indent=4).split("\n")))
+            count += 1
+        file.write("\n]" if count else "[]")
+    return count
 
-    
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
     # input_dir = "/Users/mac/Desktop/TestEvolution/common-math_output" # mac
-    input_dir = "/home/yeren/TestEvolution/nrtsearch_output"
-    output_dir = "/home/yeren/TestEvolution/nrtsearch_output"
+    parser.add_argument("--input_dir", default="/home/yeren/TestEvolution/nrtsearch_output")
+    parser.add_argument("--output_dir", default="/home/yeren/TestEvolution/nrtsearch_output")
     # project_path = "/Users/mac/Desktop/commons-math" # mac
-    project_path = "/home/yeren/java-project/nrtsearch"
-    current_path = os.getcwd()
-    old_path = os.path.join(temp_folder, "temp_old.java")
-    new_path = os.path.join(temp_folder, "temp_new.java")
-    target_path = os.path.join(temp_folder, "temp_target.json")
-    refactoring_path = os.path.join(temp_folder, "temp_refactoring.json")
-    data = read_json(input_dir + "/samples.jsonl")
-
-    index_with_not_delete = []
-    delete_number = 0
-
-    for index, json_block in tqdm(enumerate(data), total=len(data)):
-        os.chdir(current_path)
-        tag = json_block["tag"]
-        product_commit = json_block["product_commit"]
-        test_commit = json_block["test_commit"]
-        product_file_path = json_block["product_file_path"]
-        test_file_path = json_block["test_file_path"]
-        product_old_content = json_block["product_old_content"]
-        product_new_content = json_block["product_new_content"]
-        test_old_content = json_block["test_old_content"]
-        test_new_content = json_block["test_new_content"]
-
-        # debug
-        # if product_commit != "1458a9366aa9a001e25153f669a9a5bb8235a30b" or test_commit != "1458a9366aa9a001e25153f669a9a5bb8235a30b":
-        #     continue
-        # if product_file_path != "apollo-portal/src/main/java/com/ctrip/framework/apollo/portal/controller/UserInfoController.java" or test_file_path != "apollo-portal/src/test/java/com/ctrip/framework/apollo/portal/controller/UserInfoControllerTest.java":
-        #     continue
-
-        if product_old_content == None or product_new_content == None or test_old_content == None or test_new_content == None:
-            json_block["tag"] = "negative"
-            continue
-
-        # print(os.getcwd())
-        with open(old_path, "w") as file:
-            file.write(product_old_content)
-        with open(new_path, "w") as file:
-            file.write(product_new_content)
-        command = f"java -jar gumtree.jar textdiff {old_path} {new_path} -f JSON -o {target_path}"
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
-            # return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            # print(f"Error running command {' '.join(command)}: {e}")
-            logging.error(f"Error running command {' '.join(command)}: {e}")
-            continue
-        product_change_actions = read_json_low(target_path)["actions"]
-        with open(old_path, "w") as file:
-            file.write(test_old_content)
-        with open(new_path, "w") as file:
-            file.write(test_new_content)
-        command = f"java -jar gumtree.jar textdiff {old_path} {new_path} -f JSON -o {target_path}"
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
-            # return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            # print(f"Error running command {' '.join(command)}: {e}")
-            logging.error(f"Error running command {' '.join(command)}: {e}")
-            continue
-        test_change_actions = read_json_low(target_path)["actions"]
-        
-        command = f"./RefactoringMiner-3.0.4/bin/RefactoringMiner -c {project_path} {test_commit} -json {refactoring_path}"
-        try:
-            result = subprocess.run(command, capture_output=True, text=True, check=True, shell=True)
-            # return result.stdout.strip()
-        except subprocess.CalledProcessError as e:
-            # print(f"Error running command {' '.join(command)}: {e}")
-            logging.error(f"Error running command {' '.join(command)}: {e}")
-            continue
-        refactorings = read_json_low(refactoring_path)["commits"][0]["refactorings"]
-
-        if tag == "negative":
-            strategy_1(json_block, product_change_actions, test_change_actions, project_path)
-            index_with_not_delete.append(index)
-        else:
-            whether_delete = strategy_6(json_block, product_change_actions, test_change_actions, project_path)
-            if not whether_delete:
-                index_with_not_delete.append(index)
-            else:
-                delete_number += 1
-                continue
-            strategy_2(json_block, project_path)
-            strategy_3(json_block, product_change_actions, test_change_actions, project_path)
-            strategy_4(json_block, product_change_actions, test_change_actions, project_path)
-            strategy_5(json_block, product_change_actions, test_change_actions, refactorings, project_path)
-
-    print("p2n: ", p2n)
-    print("n2p: ", n2p)
-    print("delete_number: ", delete_number)
-    filter_data = [data[i] for i in index_with_not_delete]
-    with open(output_dir + "/filter.json", 'w') as file:
-        json.dump(filter_data, file, indent=4)
+    parser.add_argument("--project_path", default="/home/yeren/java-project/nrtsearch")
+    parser.add_argument("--incremental", action="store_true", help="only filter samples appended since the last run")
+    parser.add_argument("--no_gumtree_server", action="store_true", help="run gumtree.jar textdiff once per diff")
+    parser.add_argument("--no_action_cache", action="store_true", help="do not reuse cached GumTree diffs")
+    parser.add_argument("--refactorings_range", nargs=2, metavar=("START_COMMIT", "END_COMMIT"), help="precompute refactorings for a commit range with RefactoringMiner -bc")
+    parser.add_argument("--workers", type=int, default=1, help="number of filter processes")
+    parser.add_argument("--no_prefilter", action="store_true", help="send every sample to GumTree")
+    parser.add_argument("--export_pretty", action="store_true", help="only convert filter.jsonl into an indented filter.json")
+    args = parser.parse_args()
+    if args.export_pretty:
+        print(f"Exported {export_pretty(args.output_dir)} samples to {args.output_dir}/filter.json")
+    else:
+        filter_PT_pair(args.input_dir, args.output_dir, args.project_path, args.incremental, not args.no_gumtree_server,
+                       not args.no_action_cache, args.refactorings_range, args.workers, use_prefilter=not args.no_prefilter)
 
 
 
@@ -14,10 +14,12 @@ def run_git_command(command):
         logging.error(f"Error running command {' '.join(command)}: {e}")
         return None
 
-def get_commit_date(commit_hash):
+def get_commit_date(commit_hash, commit_index=None):
     """获取指定 commit 的提交日期"""
     if commit_hash == "":
         return None
+    if commit_index is not None and commit_hash in commit_index:
+        return commit_index.get_commit_date(commit_hash)
     command = ["git", "show", "-s", "--format=%ci", commit_hash]
     commit_date_str = run_git_command(command)
     if commit_date_str:
@@ -38,8 +40,11 @@ def find_commits_after_date(start_date, end_date=None):
         return []
     return ret.split('\n')
 
-def find_commits(commit_hash, hours_after, hours_until=None):
-    start_date = get_commit_date(commit_hash)
+def find_commits(commit_hash, hours_after, hours_until=None, commit_index=None):
+    if commit_index is not None and commit_hash in commit_index:
+        # 使用内存中的时间索引，避免每次调用都遍历一次 git log
+        return commit_index.find_commits(commit_hash, hours_after, hours_until)
+    start_date = get_commit_date(commit_hash, commit_index)
     if not start_date:
         print(f"Could not find commit {commit_hash}")
         return
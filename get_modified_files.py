@@ -2,6 +2,7 @@ import subprocess
 import os
 import sys
 import logging
+import git_object_reader
 
 def run_git_command(command):
     """运行 Git 命令并返回输出"""
@@ -13,8 +14,10 @@ def run_git_command(command):
         logging.error(f"Error running command {' '.join(command)}: {e}")
         return None
 
-def get_changed_files(commit_hash):
+def get_changed_files(commit_hash, commit_index=None):
     """获取指定 commit 修改的文件列表"""
+    if commit_index is not None and commit_hash in commit_index:
+        return commit_index.get_changed_files(commit_hash)
     command = ["git", "diff-tree", "--no-commit-id", "--name-only", "-r", commit_hash]
     output = run_git_command(command)
     if output:
@@ -22,24 +25,30 @@ def get_changed_files(commit_hash):
     else:
         return []
 
-def get_file_content(commit_hash, file_path):
-    """保存指定 commit 中文件的内容到目录中"""
-    try:
-        old_file_content = run_git_command(["git", "show", f"{commit_hash}^:{file_path}"])
-        new_file_content = run_git_command(["git", "show", f"{commit_hash}:{file_path}"])
-    except:
-        return None
-    if old_file_content is None and new_file_content is None:
-        return None
-    
-    # safe_file_path = file_path.replace('/', '_')
-    # file_name = f"{prefix}_{safe_file_path}"
-    # full_path = os.path.join(directory, file_name)
+def get_file_contents(requests, blob_cache=None):
+    """批量获取 [(commit, path), ...] 修改前后的文件内容，返回与 get_file_content 相同格式的列表"""
+    requests = list(requests)
+    if blob_cache is not None:
+        # 按 blob id 读取并缓存，同一版本的文件只从 git 读取一次
+        return blob_cache.get_file_contents(requests)
+    # 通过常驻的 git cat-file --batch 进程一次性读取，不再为每个版本启动 git show
+    objects = []
+    for commit_hash, file_path in requests:
+        objects.append((f"{commit_hash}^", file_path))
+        objects.append((commit_hash, file_path))
+    contents = git_object_reader.get_reader().get_contents(objects)
+    file_contents = []
+    for i in range(len(requests)):
+        old_file_content, new_file_content = contents[2 * i], contents[2 * i + 1]
+        if old_file_content is None and new_file_content is None:
+            file_contents.append(None)
+        else:
+            file_contents.append((old_file_content, new_file_content))
+    return file_contents
 
-    # with open(full_path, 'w') as file:
-    #     file.write(file_content)
-    
-    return old_file_content, new_file_content
+def get_file_content(commit_hash, file_path, blob_cache=None):
+    """保存指定 commit 中文件的内容到目录中"""
+    return get_file_contents([(commit_hash, file_path)], blob_cache)[0]
 
 def main(commit_hash, output_directory, output_file):
     if not os.path.exists(output_directory):
@@ -0,0 +1,199 @@
+import subprocess
+import os
+import logging
+import math
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+# 一次 git log 即可得到的 commit 元信息
+# changes: [(status, path), ...]，status 为 git 的 A/M/D/T 等修改类型
+# blobs: {path: (old_blob_id, new_blob_id)}，文件不存在的一侧为 None
+CommitInfo = namedtuple('CommitInfo', ['hash', 'parents', 'author_time', 'commit_time', 'commit_date', 'changes', 'blobs'])
+
+NULL_BLOB_ID = "0" * 40
+
+# 每个 commit 的头部行以 \x1e 开头，字段之间以 \x1f 分隔
+LOG_FORMAT = "%x1e%H%x1f%P%x1f%at%x1f%ct%x1f%cI"
+
+
+def parse_raw_line(line):
+    """解析一行 --raw 输出，返回 (status, path, old_blob_id, new_blob_id)"""
+    meta, _, path = line.partition('\t')
+    _, _, old_blob, new_blob, status = meta.split(' ')
+    old_blob = None if old_blob == NULL_BLOB_ID else old_blob
+    new_blob = None if new_blob == NULL_BLOB_ID else new_blob
+    return status, path, old_blob, new_blob
+
+
+def parse_log_stream(lines):
+    """逐行解析 git log --raw/--name-status 的输出，依次产出 CommitInfo"""
+    current = None
+    for line in lines:
+        line = line.rstrip('\n')
+        if line.startswith('\x1e'):
+            if current is not None:
+                yield CommitInfo(*current)
+            commit_hash, parents, author_time, commit_time, commit_date = line[1:].split('\x1f')
+            current = [commit_hash, parents.split() if parents else [], int(author_time), int(commit_time),
+                       datetime.fromisoformat(commit_date), [], {}]
+        elif line.startswith(':') and current is not None:
+            status, path, old_blob, new_blob = parse_raw_line(line)
+            current[5].append((status, path))
+            current[6][path] = (old_blob, new_blob)
+        elif line and current is not None:
+            status, _, path = line.partition('\t')
+            current[5].append((status, path))
+    if current is not None:
+        yield CommitInfo(*current)
+
+
+class CommitIndex(object):
+    """项目完整历史的内存索引，所有查询都不再调用 git"""
+
+    def __init__(self, commits):
+        # commits 保持 git log 的输出顺序（新 -> 旧）
+        self.commits = list(commits)
+        self.by_hash = {}
+        self.position = {}
+        for i, commit in enumerate(self.commits):
+            self.by_hash[commit.hash] = commit
+            self.position[commit.hash] = i
+        # 按提交时间排序的时间戳索引，用于 bisect 区间查询
+        order = sorted(range(len(self.commits)), key=lambda i: (self.commits[i].commit_time, i))
+        self.sorted_times = [self.commits[i].commit_time for i in order]
+        self.sorted_positions = order
+        # 文件路径 -> 修改过该文件的 commit（按提交时间排序），首次查询时才建立
+        self.path_times = None
+        self.path_hashes = None
+
+    def __len__(self):
+        return len(self.commits)
+
+    def __contains__(self, commit_hash):
+        return commit_hash in self.by_hash
+
+    def get_commit(self, commit_hash):
+        return self.by_hash.get(commit_hash)
+
+    def get_changes(self, commit_hash):
+        commit = self.by_hash.get(commit_hash)
+        if commit is None:
+            return None
+        return commit.changes
+
+    def get_changed_files(self, commit_hash):
+        """与 get_modified_files.get_changed_files 的返回一致：修改文件的路径列表"""
+        commit = self.by_hash.get(commit_hash)
+        if commit is None:
+            return None
+        # git diff-tree 不加 --root 时不输出根 commit 的修改文件，这里保持一致
+        if not commit.parents:
+            return []
+        return [path for _, path in commit.changes]
+
+    def get_blob_ids(self, commit_hash, file_path):
+        """返回 (修改前, 修改后) 的 blob id；该 commit 未修改此文件时返回 None"""
+        commit = self.by_hash.get(commit_hash)
+        if commit is None:
+            return None
+        return commit.blobs.get(file_path)
+
+    def get_commit_date(self, commit_hash):
+        """与 find_commit_hash_in_range.get_commit_date 的返回一致：带时区的提交日期"""
+        commit = self.by_hash.get(commit_hash)
+        if commit is None:
+            return None
+        return commit.commit_date
+
+    def ancestors(self, commit_hash):
+        """commit_hash 及其所有祖先 commit 的集合（相当于 git rev-list commit_hash）"""
+        reachable = set()
+        stack = [commit_hash]
+        while stack:
+            current = stack.pop()
+            if current in reachable or current not in self.by_hash:
+                continue
+            reachable.add(current)
+            stack.extend(self.by_hash[current].parents)
+        return reachable
+
+    def commits_between(self, since, until=None):
+        """提交时间在 [since, until] 内的 commit（闭区间，同 git log --since/--until），按 git log 顺序返回"""
+        lo = bisect_left(self.sorted_times, since)
+        hi = len(self.sorted_times) if until is None else bisect_right(self.sorted_times, until)
+        positions = sorted(self.sorted_positions[lo:hi])
+        return [self.commits[i].hash for i in positions]
+
+    def window(self, commit_hash, hours_after, hours_until=None):
+        """find_commits 的查询区间 (since, until)，until 为 None 表示没有上界"""
+        start_time = self.by_hash[commit_hash].commit_time
+        # 原实现以秒为精度格式化日期再交给 git，因此这里向下取整
+        until = None
+        if hours_until:
+            until = math.floor(start_time + hours_until * 3600)
+        since = math.floor(start_time + hours_after * 3600)
+        return since, until
+
+    def find_commits(self, commit_hash, hours_after, hours_until=None):
+        """与 find_commit_hash_in_range.find_commits 语义一致的内存版本"""
+        if commit_hash not in self.by_hash:
+            print(f"Could not find commit {commit_hash}")
+            return
+        since, until = self.window(commit_hash, hours_after, hours_until)
+
+        commits = self.commits_between(since, until)
+        if hours_after != 0 and commit_hash in commits:
+            # itself is not included when hours_after is not 0
+            commits.remove(commit_hash)
+        if hours_after == 0 and commit_hash not in commits:
+            commits.append(commit_hash)
+        commits.reverse()
+        return commits
+
+    def _build_path_index(self):
+        path_commits = {}
+        for commit in self.commits:
+            # 与 get_changed_files 一致：根 commit 不计入
+            if not commit.parents:
+                continue
+            for _, path in commit.changes:
+                path_commits.setdefault(path, []).append((commit.commit_time, commit.hash))
+        self.path_times = {}
+        self.path_hashes = {}
+        for path, entries in path_commits.items():
+            entries.sort()
+            self.path_times[path] = [time for time, _ in entries]
+            self.path_hashes[path] = [commit_hash for _, commit_hash in entries]
+
+    def path_changed_between(self, file_path, since, until=None, exclude=()):
+        """是否有提交时间在 [since, until] 内、且不在 exclude 中的 commit 修改了 file_path（二分查找）"""
+        if self.path_times is None:
+            self._build_path_index()
+        times = self.path_times.get(file_path)
+        if times is None:
+            return False
+        lo = bisect_left(times, since)
+        hi = len(times) if until is None else bisect_right(times, until)
+        hashes = self.path_hashes[file_path]
+        # 被排除的 commit 最多 len(exclude) 个，只需检查区间内的前几个
+        for i in range(lo, min(hi, lo + len(exclude) + 1)):
+            if hashes[i] not in exclude:
+                return True
+        return False
+
+
+def build_commit_index(project_path=None, rev="HEAD"):
+    """用一次流式的 git log 调用读取完整历史，构建 CommitIndex"""
+    # --no-renames 与 git diff-tree 的默认行为保持一致（不做重命名检测）
+    # --raw 在修改类型之外顺带给出新旧 blob id，供 blob_cache 直接使用
+    command = ["git", "log", "--no-renames", "--raw", "--no-abbrev", f"--format={LOG_FORMAT}", rev]
+    process = subprocess.Popen(command, cwd=project_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    commits = list(parse_log_stream(process.stdout))
+    stderr = process.stderr.read()
+    process.stdout.close()
+    process.stderr.close()
+    if process.wait() != 0:
+        logging.error(f"Error running command {' '.join(command)} in {project_path or os.getcwd()}: {stderr.strip()}")
+        return None
+    return CommitIndex(commits)
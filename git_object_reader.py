@@ -0,0 +1,109 @@
+import subprocess
+import os
+import logging
+import threading
+import atexit
+
+
+def blob_to_text(data):
+    """将 blob 内容转换为与 run_git_command(["git", "show", ...]) 相同的文本"""
+    if data is None:
+        return None
+    try:
+        text = data.decode("utf-8")
+    except UnicodeDecodeError:
+        logging.error("Blob is not valid utf-8, treated as missing")
+        return None
+    # subprocess 的 text 模式会做通用换行符转换，run_git_command 还会 strip
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip()
+
+
+class GitObjectReader(object):
+    """每个仓库一个常驻的 git cat-file --batch 进程，批量流水线式读取对象内容"""
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self.process = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def _ensure_process(self):
+        # fork 出来的子进程不能复用父进程的管道，需要各自启动
+        if self.process is None or self.process.poll() is not None or self.pid != os.getpid():
+            self.process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.repo_path,
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self.pid = os.getpid()
+        return self.process
+
+    def _read_response(self, stdout):
+        header = stdout.readline()
+        if not header:
+            raise EOFError("git cat-file --batch exited unexpectedly")
+        # <name> missing / <name> ambiguous，name 中可能含有空格
+        if header.endswith((b" missing\n", b" ambiguous\n")):
+            return None, None
+        _, object_type, size = header.split()
+        object_type, size = object_type.decode(), int(size)
+        data = stdout.read(size)
+        stdout.read(1)  # 每个对象内容之后的换行
+        return object_type, data
+
+    def get_objects(self, names):
+        """批量读取对象（blob id 或 <rev>:<path>），返回与 names 一一对应的 bytes，非 blob 或不存在时为 None"""
+        names = list(names)
+        if not names:
+            return []
+        with self.lock:
+            process = self._ensure_process()
+            request = b"".join(name.encode("utf-8") + b"\n" for name in names)
+
+            # 请求在独立线程中写入，避免输出管道写满时双方互相等待
+            def write_requests():
+                try:
+                    process.stdin.write(request)
+                    process.stdin.flush()
+                except BrokenPipeError:
+                    pass
+
+            writer = threading.Thread(target=write_requests)
+            writer.start()
+            results = []
+            try:
+                for _ in names:
+                    object_type, data = self._read_response(process.stdout)
+                    results.append(data if object_type == "blob" else None)
+            except EOFError as e:
+                logging.error(f"Error reading objects from {self.repo_path}: {e}")
+                self.process = None
+                results.extend([None] * (len(names) - len(results)))
+            writer.join()
+            return results
+
+    def get_contents(self, requests):
+        """批量读取 [(commit, path), ...] 的文件内容，返回与 git show <commit>:<path> 相同的文本"""
+        datas = self.get_objects(f"{commit}:{path}" for commit, path in requests)
+        return [blob_to_text(data) for data in datas]
+
+    def close(self):
+        if self.process is not None and self.pid == os.getpid():
+            self.process.stdin.close()
+            self.process.wait()
+        self.process = None
+
+
+readers = {}
+
+
+def get_reader(repo_path=None):
+    """获取 repo_path（默认当前目录）对应的读取器，同一仓库共享一个 cat-file 进程"""
+    repo_path = os.path.realpath(repo_path or os.getcwd())
+    reader = readers.get(repo_path)
+    if reader is None:
+        reader = readers[repo_path] = GitObjectReader(repo_path)
+    return reader
+
+
+@atexit.register
+def close_readers():
+    for reader in readers.values():
+        reader.close()
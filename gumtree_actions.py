@@ -0,0 +1,46 @@
+import re
+
+# GumTree 动作中节点位置的格式：类型: 标签 [起始下标,结束下标]
+range_pattern = re.compile(r"\[(\d+),(\d+)\]")
+
+
+def extract_range(text):
+    """与 filter_PT_pair.extract_start_end_line 相同：取第一个 [d,d]，没有时返回 (None, None)"""
+    match = range_pattern.search(text)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None, None
+
+
+class Action(object):
+    """解析后的 GumTree 动作，各策略需要的字段在构造时一次计算好"""
+
+    __slots__ = ("kind", "tree", "node_type", "start", "end", "parent_start", "parent_end",
+                 "is_import", "is_qualified_name", "is_annotation_or_modifier", "is_text_element")
+
+    def __init__(self, raw_action):
+        tree = raw_action["tree"]
+        # insert-node / insert-tree -> insert，其余为 delete、update、move
+        self.kind = raw_action["action"].split("-")[0]
+        self.tree = tree
+        # 与原来的 tree.split(":")[0] 一致（没有标签的节点会包含位置部分）
+        self.node_type = tree.split(":")[0]
+        self.start, self.end = extract_range(tree)
+        # strategy_4 优先使用父节点的范围
+        if "parent" in raw_action:
+            self.parent_start, self.parent_end = extract_range(raw_action["parent"])
+        else:
+            self.parent_start, self.parent_end = self.start, self.end
+        self.is_import = tree.startswith("ImportDeclaration")
+        self.is_qualified_name = tree.startswith("QualifiedName")
+        # 与 strategy_5 原来的判断一致："Annotation" 出现在节点字符串的任意位置即可
+        self.is_annotation_or_modifier = "Annotation" in tree or tree.startswith("Modifier")
+        self.is_text_element = self.node_type == "TextElement"
+
+    def __repr__(self):
+        return f"Action({self.kind}, {self.tree!r})"
+
+
+def parse_actions(raw_actions):
+    """GumTree JSON 中的 actions 列表 -> [Action]"""
+    return [Action(raw_action) for raw_action in raw_actions]
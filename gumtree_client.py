@@ -0,0 +1,187 @@
+import subprocess
+import os
+import json
+import queue
+import threading
+import atexit
+import shutil
+import tempfile
+
+gumtree_jar = os.path.abspath("gumtree.jar")
+server_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gumtree_server")
+server_classes = os.path.join(server_dir, "classes")
+
+
+class GumTreeError(Exception):
+    pass
+
+
+class GumTreeServerError(GumTreeError):
+    """GumTreeServer 启动失败或处理请求时退出（与文件内容无关），调用方可以对该请求改用 textdiff"""
+    pass
+
+
+class GumTreeUnavailable(GumTreeServerError):
+    """GumTreeServer 连续多次启动失败或异常退出，不再重启"""
+    pass
+
+
+# 启动服务后用于确认其可用的最小 diff
+probe_content = "class GumTreeProbe {}\n"
+
+
+def compile_server(jar_path=gumtree_jar):
+    """用 gumtree.jar 编译 GumTreeServer（只在 class 文件不存在时编译一次）"""
+    if os.path.exists(os.path.join(server_classes, "GumTreeServer.class")):
+        return
+    os.makedirs(server_classes, exist_ok=True)
+    # 先编译到独立的临时目录再替换，多个筛选任务同时启动时不会读到写了一半的 class 文件
+    build_dir = tempfile.mkdtemp(dir=server_dir)
+    try:
+        command = ["javac", "-cp", jar_path, "-d", build_dir, os.path.join(server_dir, "GumTreeServer.java")]
+        subprocess.run(command, capture_output=True, text=True, check=True)
+        os.replace(os.path.join(build_dir, "GumTreeServer.class"), os.path.join(server_classes, "GumTreeServer.class"))
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+
+class GumTreeClient(object):
+    """与一个常驻的 GumTreeServer JVM 进程通信，每次 diff 不再启动新的 java 进程"""
+
+    def __init__(self, jar_path=gumtree_jar, max_failures=3):
+        self.jar_path = jar_path
+        self.process = None
+        self.max_failures = max_failures
+        # 连续的启动失败或进程退出次数，达到 max_failures 后不再重启 JVM
+        self.failures = 0
+
+    @property
+    def available(self):
+        return self.failures < self.max_failures
+
+    def _failed(self, message):
+        self.close()
+        self.failures += 1
+        if not self.available:
+            return GumTreeUnavailable(f"{message} ({self.failures} failures in a row, not restarting)")
+        return GumTreeServerError(message)
+
+    def start(self):
+        """启动服务进程，并用一次探测 diff 确认它能正常工作（例如与本地 gumtree.jar 的 API 匹配）"""
+        if not self.available:
+            raise GumTreeUnavailable(f"GumTree server failed {self.failures} times in a row, not restarting")
+        try:
+            compile_server(self.jar_path)
+            classpath = os.pathsep.join([self.jar_path, server_classes])
+            self.process = subprocess.Popen(["java", "-cp", classpath, "GumTreeServer"],
+                                            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            self._request(probe_content, probe_content)
+        except (OSError, subprocess.CalledProcessError, GumTreeError) as e:
+            raise self._failed(f"GumTree server failed to start: {e}")
+
+    def _request(self, old_content, new_content):
+        old_bytes = old_content.encode("utf-8")
+        new_bytes = new_content.encode("utf-8")
+        try:
+            self.process.stdin.write(f"{len(old_bytes)} {len(new_bytes)}\n".encode("utf-8") + old_bytes + new_bytes)
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+            if not header:
+                raise OSError("GumTree server exited unexpectedly")
+            status, size = header.decode("utf-8").split()
+            body = self.process.stdout.read(int(size))
+        except (OSError, ValueError) as e:
+            self.close()
+            raise GumTreeError(f"GumTree server failed: {e}")
+        if status != "OK":
+            raise GumTreeError(body.decode("utf-8", "replace"))
+        return json.loads(body)
+
+    def diff(self, old_content, new_content):
+        """返回与 gumtree textdiff -f JSON 相同的结果（dict）"""
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+        try:
+            result = self._request(old_content, new_content)
+        except GumTreeError as e:
+            if self.process is not None:
+                # 服务正常返回了错误（例如无法解析的文件），不影响后续请求
+                raise
+            raise self._failed(str(e))
+        self.failures = 0
+        return result
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.stdout.close()
+            except OSError:
+                pass
+            self.process.wait()
+            self.process = None
+
+
+class GumTreeClientPool(object):
+    """多个 GumTreeServer 进程组成的池，多个线程可以同时提交 diff 请求"""
+
+    def __init__(self, size=1, jar_path=gumtree_jar):
+        self.clients = [GumTreeClient(jar_path) for _ in range(size)]
+        self.idle = queue.Queue()
+        for client in self.clients:
+            self.idle.put(client)
+
+    @property
+    def available(self):
+        return any(client.available for client in self.clients)
+
+    def start(self):
+        for client in self.clients:
+            client.start()
+
+    def diff(self, old_content, new_content):
+        client = self.idle.get()
+        try:
+            return client.diff(old_content, new_content)
+        finally:
+            self.idle.put(client)
+
+    def diff_many(self, content_pairs):
+        """并发地 diff 多对 (old, new)，按输入顺序返回结果，出错的位置为 GumTreeError"""
+        content_pairs = list(content_pairs)
+        results = [None] * len(content_pairs)
+
+        def run(i):
+            try:
+                results[i] = self.diff(*content_pairs[i])
+            except GumTreeError as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(content_pairs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+
+
+pools = []
+
+
+def open_pool(size=1, jar_path=gumtree_jar):
+    pool = GumTreeClientPool(size, jar_path)
+    pools.append(pool)
+    return pool
+
+
+@atexit.register
+def close_pools():
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,79 @@
+import com.github.gumtreediff.actions.EditScript;
+import com.github.gumtreediff.actions.EditScriptGenerator;
+import com.github.gumtreediff.actions.SimplifiedChawatheScriptGenerator;
+import com.github.gumtreediff.client.Run;
+import com.github.gumtreediff.gen.jdt.JdtTreeGenerator;
+import com.github.gumtreediff.io.ActionsIoUtils;
+import com.github.gumtreediff.matchers.MappingStore;
+import com.github.gumtreediff.matchers.Matcher;
+import com.github.gumtreediff.matchers.Matchers;
+import com.github.gumtreediff.tree.TreeContext;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.DataInputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.StringWriter;
+import java.nio.charset.StandardCharsets;
+
+/**
+ * Long-running GumTree diff service, so that the filter stage does not pay JVM start-up for every sample.
+ *
+ * Protocol over stdin/stdout, one request at a time:
+ *   request:  "<old byte length> <new byte length>\n" followed by the old and the new file content (UTF-8)
+ *   response: "OK <byte length>\n" followed by the same JSON as "gumtree textdiff -f JSON",
+ *             or "ERROR <byte length>\n" followed by the error message
+ */
+public class GumTreeServer {
+
+    public static void main(String[] args) throws IOException {
+        Run.initGenerators();
+        DataInputStream in = new DataInputStream(new BufferedInputStream(System.in));
+        OutputStream out = new BufferedOutputStream(System.out);
+        // same defaults as textdiff: default matcher and the simplified Chawathe edit script
+        Matcher matcher = Matchers.getInstance().getMatcher();
+        EditScriptGenerator scriptGenerator = new SimplifiedChawatheScriptGenerator();
+
+        String header;
+        while ((header = readLine(in)) != null) {
+            String[] sizes = header.trim().split(" ");
+            byte[] oldBytes = new byte[Integer.parseInt(sizes[0])];
+            byte[] newBytes = new byte[Integer.parseInt(sizes[1])];
+            in.readFully(oldBytes);
+            in.readFully(newBytes);
+            try {
+                TreeContext src = new JdtTreeGenerator().generateFrom().string(new String(oldBytes, StandardCharsets.UTF_8));
+                TreeContext dst = new JdtTreeGenerator().generateFrom().string(new String(newBytes, StandardCharsets.UTF_8));
+                MappingStore mappings = matcher.match(src.getRoot(), dst.getRoot());
+                EditScript actions = scriptGenerator.computeActions(mappings);
+                StringWriter writer = new StringWriter();
+                ActionsIoUtils.toJson(src, actions, mappings).writeTo(writer);
+                write(out, "OK", writer.toString());
+            } catch (Exception e) {
+                write(out, "ERROR", String.valueOf(e));
+            }
+            out.flush();
+        }
+    }
+
+    private static void write(OutputStream out, String status, String body) throws IOException {
+        byte[] bytes = body.getBytes(StandardCharsets.UTF_8);
+        out.write((status + " " + bytes.length + "\n").getBytes(StandardCharsets.UTF_8));
+        out.write(bytes);
+    }
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int c;
+        while ((c = in.read()) != -1 && c != '\n') {
+            line.write(c);
+        }
+        if (c == -1 && line.size() == 0) {
+            return null;
+        }
+        return new String(line.toByteArray(), StandardCharsets.UTF_8);
+    }
+}
@@ -0,0 +1,27 @@
+from bisect import bisect_right
+from itertools import accumulate
+
+
+class SpanIndex(object):
+    """一组区间 [start, end] 的索引：按 start 排序并记录 end 的前缀最大值，
+    判断某个区间是否被其中任意一个区间包含只需一次二分查找"""
+
+    def __init__(self, spans):
+        spans = sorted(spans)
+        self.starts = [start for start, _ in spans]
+        # max_ends[i] 为前 i + 1 个区间（start 最小的）中最大的 end
+        self.max_ends = list(accumulate((end for _, end in spans), max))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def covers(self, start, end):
+        """是否存在区间满足 span_start <= start 且 span_end >= end；位置未知（None）的修改视为未被覆盖"""
+        if start is None or end is None:
+            return False
+        i = bisect_right(self.starts, start)
+        return i > 0 and self.max_ends[i - 1] >= end
+
+    def remove_covered(self, changes):
+        """返回没有被任何区间包含的修改，保持原有顺序"""
+        return [change for change in changes if not self.covers(change[0], change[1])]
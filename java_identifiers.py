@@ -0,0 +1,39 @@
+import re
+import javalang_tokenizer
+
+# 与 JavaTokenizer 的分类一致：关键字以及 true/false/null 不是标识符
+NON_IDENTIFIERS = javalang_tokenizer.Keyword.VALUES | javalang_tokenizer.Boolean.VALUES | {"null"}
+
+# 一次扫描：注释、文本块、字符串/字符字面量、数字字面量和 \u 转义整体跳过，只有最后一个分组捕获标识符。
+# 修改片段可能在任意位置截断，未闭合的注释和字面量匹配到片段（字符串为行）末尾，不会抛出异常
+token_pattern = re.compile(r'''
+    //[^\n]*
+  | /\*.*?(?:\*/|\Z)
+  | """.*?(?:"""|\Z)
+  | "(?:\\.|[^"\\\n])*"?
+  | '(?:\\.|[^'\\\n])*'?
+  | \d[\w.]*
+  | \\u+[0-9a-fA-F]{0,4}
+  | ([^\W\d][\w$]*|\$[\w$]*)
+''', re.S | re.X)
+
+
+def merge_ranges(ranges):
+    """合并重叠或相邻的 [start, end) 范围，多个动作共用同一个父节点时每个字符只扫描一次"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def identifier_set(content, ranges):
+    """返回 content 中各个范围内的 Java 标识符集合（不含关键字、字面量、注释和字符串中的单词）"""
+    identifiers = set()
+    for start, end in merge_ranges(ranges):
+        identifiers.update(token_pattern.findall(content, start, end))
+    identifiers.discard("")
+    return identifiers - NON_IDENTIFIERS
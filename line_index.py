@@ -0,0 +1,42 @@
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+
+class LineIndex(object):
+    """一份文本的行首偏移表：建立一次后，行列号 -> 字符下标为 O(1)，字符下标 -> 行列号为 O(log n)
+    行号、列号均从 1 开始，与 RefactoringMiner 的 location 一致"""
+
+    def __init__(self, text):
+        self.line_lengths = [len(line) for line in text.split('\n')]
+        # line_starts[k] 为前 k 行（含换行符）的总长度，即第 k + 1 行的起始下标
+        self.line_starts = [0] + list(accumulate(length + 1 for length in self.line_lengths))
+
+    def __len__(self):
+        return len(self.line_lengths)
+
+    def to_offset(self, line, column, clamp=True):
+        """行列号 -> 字符下标
+        clamp=True: 行号限制在 [1, 行数] 内，列号不超过该行长度（filter_PT_pair 原来的语义）
+        clamp=False: 不做限制，与 convert_line_range 原来的逐行求和结果相同（行号超过行数 + 1 时抛出 IndexError）"""
+        if clamp:
+            line = max(1, min(line, len(self.line_lengths)))
+            return self.line_starts[line - 1] + min(column - 1, self.line_lengths[line - 1])
+        k = max(0, line - 1)
+        if k > len(self.line_lengths):
+            raise IndexError("line out of range")
+        return self.line_starts[k] + column - 1
+
+    def to_line_col(self, offset):
+        """字符下标 -> (行号, 列号)"""
+        line = max(1, min(bisect_right(self.line_starts, offset), len(self.line_lengths)))
+        return line, offset - self.line_starts[line - 1] + 1
+
+    def span(self, start_line, start_column, end_line, end_column, clamp=True):
+        return self.to_offset(start_line, start_column, clamp), self.to_offset(end_line, end_column, clamp)
+
+
+@lru_cache(maxsize=256)
+def line_index_for(text):
+    """同一份文件内容（同一个 blob）只建立一次 LineIndex"""
+    return LineIndex(text)
@@ -0,0 +1,37 @@
+import os
+import zlib
+
+
+def atomic_write(path, data):
+    """先写临时文件再原子替换，并发读取的进程只会看到完整的文件"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+class ObjectStore(object):
+    """以十六进制 id 为键的 zlib 压缩文件存储，布局为 <root>/<id[:2]>/<id[2:]>
+    blob 缓存、规范化样本的内容存储和 GumTree 动作缓存共用这一实现"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, object_id):
+        return os.path.join(self.root, object_id[:2], object_id[2:])
+
+    def contains(self, object_id):
+        return os.path.exists(self.path(object_id))
+
+    def read(self, object_id):
+        """返回解压后的 bytes；文件不存在或损坏时抛出 OSError / zlib.error，由调用方决定如何处理"""
+        with open(self.path(object_id), "rb") as file:
+            return zlib.decompress(file.read())
+
+    def write(self, object_id, data):
+        """压缩并写入，返回写入磁盘的字节数"""
+        compressed = zlib.compress(data)
+        atomic_write(self.path(object_id), compressed)
+        return len(compressed)
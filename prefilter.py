@@ -0,0 +1,53 @@
+import itertools
+import javalang_tokenizer
+
+# 在调用 GumTree 之前用低成本的检查判断文件修改是否不影响 AST。
+# 只要 product 或 test 一侧没有 AST 修改，GumTree 对该侧的结果就是 []，
+# 此时 strategy_1 直接保留负样本、strategy_6 直接删除正样本，不需要再 diff。
+# 检查按成本从低到高排列，返回命中的层级名称，无法判断时返回 None。
+
+TIERS = ["identical", "whitespace", "comment"]
+
+
+def is_javadoc(token):
+    return isinstance(token, javalang_tokenizer.Comment) and token.value.startswith("/**")
+
+
+def significant_tokens(code, keep_comments):
+    # keep_comments=True 时保留所有注释；False 时只保留 javadoc（JDT 会将其解析为 AST 节点，其余注释不在 AST 中）
+    for token in javalang_tokenizer.tokenize(code, keep_comments=True):
+        if keep_comments or not isinstance(token, javalang_tokenizer.Comment) or is_javadoc(token):
+            yield token.__class__, token.value
+
+
+def tokens_equal(old_content, new_content, keep_comments):
+    """逐个比较两份代码的 token，遇到第一个不同的 token 即返回 False；词法分析失败时返回 None"""
+    try:
+        for old_token, new_token in itertools.zip_longest(significant_tokens(old_content, keep_comments),
+                                                          significant_tokens(new_content, keep_comments)):
+            if old_token != new_token:
+                return False
+    except Exception:
+        # 除 LexerError 外，词法分析器在文件以数字字面量或不完整的 \u 转义结尾时还会抛出 TypeError 等异常，
+        # 此时无法判断，交给 GumTree
+        return None
+    return True
+
+
+def prefilter_sample(json_block):
+    """product 或 test 任一侧没有 AST 修改时返回命中的层级，否则返回 None（需要 GumTree 判断）
+    每一层先检查两侧，再进入成本更高的下一层"""
+    pairs = [(json_block["product_old_content"], json_block["product_new_content"]),
+             (json_block["test_old_content"], json_block["test_new_content"])]
+    for old_content, new_content in pairs:
+        if old_content == new_content:
+            return "identical"
+    for old_content, new_content in pairs:
+        # 去掉空白后仍不同的代码，包含注释的 token 序列不可能相同，跳过这一层的词法分析
+        if "".join(old_content.split()) == "".join(new_content.split()) \
+                and tokens_equal(old_content, new_content, keep_comments=True):
+            return "whitespace"
+    for old_content, new_content in pairs:
+        if tokens_equal(old_content, new_content, keep_comments=False):
+            return "comment"
+    return None
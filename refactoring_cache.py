@@ -0,0 +1,78 @@
+import json
+import os
+import subprocess
+import logging
+import object_store
+from blob_cache import cache_folder
+
+refactoring_miner = os.path.abspath("RefactoringMiner-3.0.4/bin/RefactoringMiner")
+
+
+class RefactoringCache(object):
+    """按 commit 缓存 RefactoringMiner 的检测结果：内存 + 磁盘（cache/<项目名>/refactorings/<commit>.json），
+    每个 commit 只运行一次 RefactoringMiner"""
+
+    def __init__(self, project_path, cache_dir, work_dir):
+        self.project_path = project_path
+        self.cache_dir = cache_dir
+        self.work_dir = work_dir
+        self.memory = {}
+        self.runs = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, commit_hash):
+        return os.path.join(self.cache_dir, f"{commit_hash}.json")
+
+    def _save(self, commit_hash, refactorings):
+        self.memory[commit_hash] = refactorings
+        object_store.atomic_write(self._path(commit_hash), json.dumps(refactorings).encode("utf-8"))
+
+    def _run(self, arguments):
+        """运行 RefactoringMiner 并返回 json 输出中的 commits 列表，出错时返回 None"""
+        output_path = os.path.join(self.work_dir, "refactoring.json")
+        command = [refactoring_miner] + arguments + ["-json", output_path]
+        self.runs += 1
+        try:
+            # 所有 commit 共用同一个输出文件，先删除上一次的结果，避免 RefactoringMiner 未重写时读到其他 commit 的重构
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            subprocess.run(command, capture_output=True, text=True, check=True)
+            with open(output_path, 'r') as file:
+                return json.load(file)["commits"]
+        except (subprocess.CalledProcessError, OSError, ValueError, KeyError) as e:
+            logging.error(f"Error running command {' '.join(command)}: {e}")
+            return None
+
+    def get(self, commit_hash):
+        """返回 commit 中检测到的重构列表，RefactoringMiner 出错时返回 None（不缓存）"""
+        if commit_hash in self.memory:
+            return self.memory[commit_hash]
+        try:
+            with open(self._path(commit_hash), 'r') as file:
+                refactorings = json.load(file)
+            self.memory[commit_hash] = refactorings
+            return refactorings
+        except (OSError, ValueError):
+            pass
+        commits = self._run(["-c", self.project_path, commit_hash])
+        if commits is None:
+            return None
+        # merge commit 等情况下 RefactoringMiner 不输出该 commit
+        refactorings = commits[0]["refactorings"] if commits else []
+        self._save(commit_hash, refactorings)
+        return refactorings
+
+    def precompute(self, start_commit, end_commit):
+        """用 RefactoringMiner 的 -bc 模式在一个 JVM 中检测 (start_commit, end_commit] 内所有 commit 并写入缓存"""
+        commits = self._run(["-bc", self.project_path, start_commit, end_commit])
+        if commits is None:
+            return 0
+        for commit in commits:
+            self._save(commit["sha1"], commit["refactorings"])
+        return len(commits)
+
+
+def open_refactoring_cache(project_path, work_dir):
+    """与 blob 缓存共用项目目录：cache/<项目名>/refactorings"""
+    cache_dir = os.path.join(cache_folder, os.path.basename(os.path.normpath(project_path)), "refactorings")
+    return RefactoringCache(project_path, cache_dir, work_dir)
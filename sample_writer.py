@@ -0,0 +1,103 @@
+import json
+import os
+import re
+
+
+def shard_path(output_path, shard):
+    """第 0 个分片就是 output_path 本身，之后依次为 samples-00001.jsonl、samples-00002.jsonl ..."""
+    if shard == 0:
+        return output_path
+    root, ext = os.path.splitext(output_path)
+    return f"{root}-{shard:05d}{ext}"
+
+
+def list_shards(output_path):
+    """按顺序返回 output_path 已存在的所有分片"""
+    directory = os.path.dirname(output_path) or "."
+    root, ext = os.path.splitext(os.path.basename(output_path))
+    pattern = re.compile(re.escape(root) + r"-(\d{5})" + re.escape(ext) + "$")
+    shards = []
+    if os.path.exists(output_path):
+        shards.append((0, output_path))
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = pattern.match(name)
+            if match:
+                shards.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(shards)]
+
+
+def count_records(output_path):
+    """统计所有分片中的记录数（只数行，不解析json）"""
+    count = 0
+    for path in list_shards(output_path):
+        with open(path, "rb") as file:
+            for _ in file:
+                count += 1
+    return count
+
+
+def truncate_shards(output_path, shard, offset):
+    """截断到 (shard, offset) 位置：删除其后的分片，并截掉该分片 offset 之后的内容（包括写了一半的记录）"""
+    for path in list_shards(output_path):
+        if path != output_path and int(os.path.splitext(path)[0][-5:]) > shard:
+            os.remove(path)
+    path = shard_path(output_path, shard)
+    if os.path.exists(path):
+        with open(path, "r+b") as file:
+            file.truncate(offset)
+
+
+class SampleWriter(object):
+    """保持文件打开、缓冲并批量写入 jsonl 样本，可按大小切分为多个分片"""
+
+    def __init__(self, output_path, batch_size=100, max_shard_bytes=None):
+        self.output_path = output_path
+        self.batch_size = batch_size
+        self.max_shard_bytes = max_shard_bytes
+        self.buffer = []
+        self.written = 0
+        # 追加写入时从最后一个已存在的分片继续
+        shards = list_shards(output_path)
+        self.shard = len(shards) - 1 if shards else 0
+        self.file = open(shard_path(output_path, self.shard), "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, json_block):
+        self.buffer.append(json.dumps(json_block) + "\n")
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def _rotate(self):
+        self.file.close()
+        self.shard += 1
+        self.file = open(shard_path(self.output_path, self.shard), "a")
+
+    def flush(self):
+        """将缓冲区中的样本写入文件（不保证落盘）"""
+        for line in self.buffer:
+            # 当前分片已满时切换到下一个分片，单条样本不会被拆开
+            if self.max_shard_bytes is not None and self.file.tell() > 0 \
+                    and self.file.tell() + len(line.encode("utf-8")) > self.max_shard_bytes:
+                self._rotate()
+            self.file.write(line)
+        self.written += len(self.buffer)
+        self.buffer = []
+        self.file.flush()
+
+    def checkpoint(self):
+        """写出缓冲区并 fsync，保证此前的样本已经落盘，返回当前写入位置 (shard, offset)"""
+        self.flush()
+        os.fsync(self.file.fileno())
+        return self.shard, self.file.tell()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.checkpoint()
+        self.file.close()
@@ -0,0 +1,74 @@
+import re
+from functools import partial
+
+# 每条映射规则是一对函数 (product_key, test_key)：
+# product_key(product路径) 与 test_key(修改文件路径) 返回相同的键时，两者即构成对应的 product/test 文件，
+# 返回 None 表示该规则不适用于此路径
+
+
+def same_module_product_key(test_suffix, product_file_path):
+    # src/main/java/.../Foo.java -> src/test/java/.../Foo<test_suffix>（与 test_product_code_filter 一致）
+    path_info = re.sub(r"src/main/java", "src/test/java", product_file_path)
+    return path_info[:-5] + test_suffix
+
+def same_module_test_key(changed_file_path):
+    return changed_file_path
+
+
+def any_module_product_key(test_suffix, product_file_path):
+    # Maven 多模块项目中测试可能位于其他模块：只比较 src/main/java 之后的包路径
+    if "src/main/java/" not in product_file_path:
+        return None
+    return product_file_path.split("src/main/java/", 1)[1][:-5] + test_suffix
+
+def any_module_test_key(changed_file_path):
+    if "src/test/java/" not in changed_file_path:
+        return None
+    return changed_file_path.split("src/test/java/", 1)[1]
+
+
+def same_module_rule(test_suffix):
+    return partial(same_module_product_key, test_suffix), same_module_test_key
+
+def any_module_rule(test_suffix):
+    return partial(any_module_product_key, test_suffix), any_module_test_key
+
+
+# 默认规则与原来的 test_product_code_filter 完全一致
+TEST_PATH_RULES = [
+    same_module_rule("Test.java"),
+]
+
+# 扩展规则：*Tests.java、*IT.java，以及测试位于其他模块的 Maven 多模块布局
+EXTENDED_TEST_PATH_RULES = TEST_PATH_RULES + [
+    same_module_rule("Tests.java"),
+    same_module_rule("IT.java"),
+    any_module_rule("Test.java"),
+]
+
+
+class TestPathIndex(object):
+    """一个 origin commit 的 product 文件按映射规则预先建立的索引，匹配时每个修改文件只需一次字典查询"""
+
+    def __init__(self, product_files_paths, rules=None):
+        self.rules = TEST_PATH_RULES if rules is None else rules
+        # (规则序号, 键) -> [product路径]
+        self.index = {}
+        for product_files_path in product_files_paths:
+            for i, (product_key, _) in enumerate(self.rules):
+                key = product_key(product_files_path)
+                if key is not None:
+                    self.index.setdefault((i, key), []).append(product_files_path)
+
+    def match(self, related_changed_files):
+        """返回 {product路径: 对应的test文件}，每个product取修改文件列表中第一个匹配的test文件"""
+        matched = {}
+        for related_changed_file in related_changed_files:
+            for i, (_, test_key) in enumerate(self.rules):
+                key = test_key(related_changed_file)
+                if key is None:
+                    continue
+                for product_files_path in self.index.get((i, key), ()):
+                    if product_files_path not in matched:
+                        matched[product_files_path] = related_changed_file
+        return matched